@@ -1,18 +1,37 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import (Flask, render_template, stream_template, request, redirect, url_for, flash,
+                   get_flashed_messages, session, jsonify, Response, g)
+from flask.json.provider import DefaultJSONProvider
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 import mysql.connector
-from mysql.connector import Error, pooling
+from mysql.connector import Error, PoolError, pooling
 from config import Config
 import sys
 import os
 import time
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+import queue
+import atexit
 from urllib.parse import urlparse
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from collections import OrderedDict
 import random
+import hashlib
+import gzip
 import threading
+from jinja2 import FileSystemBytecodeCache
+
+try:
+    import orjson
+except ImportError:  # Fall back to Flask's stdlib json encoder
+    orjson = None
+
+try:
+    import redis
+except ImportError:  # Book cache stays in-process
+    redis = None
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -21,19 +40,68 @@ app = Flask(__name__)
 env = os.getenv('FLASK_ENV', 'development')
 if env == 'production':
     app.config.from_object('config.ProductionConfig')
+    
+    # Templates don't change in production: skip per-render stat() checks, reuse compiled
+    # bytecode across worker restarts, and compile everything once at startup
+    app.jinja_env.auto_reload = False
+    # No directory argument: Jinja uses a per-user temp directory created with mode 0700
+    # and refuses one owned by someone else, since it loads marshalled code from it
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
+    for template_name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(template_name)
 else:
     app.config.from_object('config.DevelopmentConfig')
 
+class ORJSONProvider(DefaultJSONProvider):
+    """JSON provider that encodes with orjson instead of the stdlib json module"""
+    
+    def dumps(self, obj, **kwargs):
+        # Flask's default() still handles types orjson doesn't (e.g. Decimal from SUM())
+        return orjson.dumps(obj, default=self.default).decode()
+    
+    def loads(self, s, **kwargs):
+        # Hooks such as the session serializer's object_hook need the stdlib decoder
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+if orjson is not None:
+    app.json = ORJSONProvider(app)
+
 # Configure logging
+_log_listener = None
+
+def start_log_listener(handler):
+    """Send app.logger records through a new queue to a background thread writing to handler.
+    
+    Threads don't survive fork(), so a worker forked from a preloaded app must
+    call this again (see post_fork in gunicorn.conf.py).
+    """
+    global _log_listener
+    for old_handler in [h for h in app.logger.handlers if isinstance(h, QueueHandler)]:
+        app.logger.removeHandler(old_handler)
+    log_queue = queue.Queue(-1)
+    _log_listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    _log_listener.start()
+    app.logger.addHandler(QueueHandler(log_queue))
+
+def stop_log_listener():
+    """Flush queued log records and stop the background writer"""
+    if _log_listener is not None:
+        _log_listener.stop()
+
 if not app.debug:
     if not os.path.exists('logs'):
         os.mkdir('logs')
-    file_handler = RotatingFileHandler('logs/bookstore.log', maxBytes=10240, backupCount=10)
+    file_handler = RotatingFileHandler('logs/bookstore.log', maxBytes=10 * 1024 * 1024, backupCount=5)
     file_handler.setFormatter(logging.Formatter(
         '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
     ))
     file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
+    
+    # Write log records from a background thread so request threads never block on disk I/O
+    start_log_listener(file_handler)
+    atexit.register(stop_log_listener)  # Flush queued records on shutdown
     app.logger.setLevel(logging.INFO)
     app.logger.info('Book Store Management System startup')
 
@@ -52,18 +120,25 @@ class User(UserMixin):
 @login_manager.user_loader
 def load_user(username):
     """Load user by username for Flask-Login"""
+    # Flask-Login calls this on every authenticated request, so check the cache first
+    exists = get_cached_user(username)
+    if exists is not None:
+        return User(username) if exists else None
+    
     try:
-        conn = get_db_connection()
-        if conn:
-            cursor = conn.cursor(dictionary=True)
+        if app.config['ENABLE_LOGIN_BATCHING']:
+            user_data = user_lookup.lookup(username)
+            cache_user(username, user_data is not None)
+            return User(user_data['username']) if user_data else None
+        
+        with db_conn(read_only=True) as (conn, cursor):
             cursor.execute("SELECT username FROM signup WHERE username = %s", (username,))
             user_data = cursor.fetchone()
-            cursor.close()
-            conn.close()
-            if user_data:
-                return User(user_data['username'])
+        cache_user(username, user_data is not None)
+        if user_data:
+            return User(user_data[0])
     except Error as e:
-        app.logger.error(f"Error loading user: {e}")
+        app.logger.error("Error loading user: %s", e)
     return None
 
 def parse_database_url(url):
@@ -79,100 +154,729 @@ def parse_database_url(url):
         }
     return None
 
-# Global connection pool (singleton pattern)
+# Global connection pools (singleton pattern). Writers get their own pool so
+# bursts of read traffic (stock pages, AJAX book lookups) can't starve /sell
 _connection_pool = None
+_read_pool = None
 _pool_lock = threading.Lock()
 
+# Connection settings per pool kind, kept for opening overflow connections
+_pool_settings = {}
+
+def get_pool_size(env_var, default):
+    """Read a pool size from the environment, falling back to default"""
+    try:
+        pool_size = int(os.getenv(env_var, str(default)))
+        # mysql-connector refuses pools larger than CNX_POOL_MAXSIZE (32)
+        if pool_size < 1 or pool_size > pooling.CNX_POOL_MAXSIZE:
+            app.logger.warning("Invalid %s %s, using default %s", env_var, pool_size, default)
+            pool_size = default
+    except (ValueError, TypeError):
+        app.logger.warning("%s must be a number, using default %s", env_var, default)
+        pool_size = default
+    return pool_size
+
+def get_primary_config():
+    """Connection settings for the primary database"""
+    if app.config.get('DATABASE_URL'):
+        return parse_database_url(app.config['DATABASE_URL'])
+    return {
+        'host': app.config['DB_HOST'],
+        'user': app.config['DB_USER'],
+        'password': app.config['DB_PASSWORD'],
+        'database': app.config['DB_NAME']
+    }
+
+def connection_settings(db_config, autocommit=False):
+    """Keyword arguments for a MySQL connection with the app's connection settings"""
+    return dict(
+        **db_config,
+        connect_timeout=app.config['DB_CONNECT_TIMEOUT'],
+        autocommit=autocommit,
+        # Decode rows in C when the extension is installed; the pure-Python
+        # protocol is several times slower on large result sets
+        use_pure=not mysql.connector.HAVE_CEXT,
+        compress=app.config['DB_COMPRESS']
+    )
+
+def create_pool(pool_name, db_config, pool_size, reset_session=True, autocommit=False):
+    """Create a MySQL connection pool with the app's connection settings"""
+    return pooling.MySQLConnectionPool(
+        pool_name=pool_name,
+        pool_size=pool_size,
+        pool_reset_session=reset_session,
+        **connection_settings(db_config, autocommit)
+    )
+
 def get_connection_pool():
-    """Get or create connection pool (singleton pattern)"""
+    """Get or create the write connection pool (singleton pattern)"""
     global _connection_pool
     
     if _connection_pool is None:
         with _pool_lock:
             if _connection_pool is None:  # Double-check locking
                 try:
-                    db_config = None
-                    if app.config.get('DATABASE_URL'):
-                        db_config = parse_database_url(app.config['DATABASE_URL'])
-                    else:
-                        db_config = {
-                            'host': app.config['DB_HOST'],
-                            'user': app.config['DB_USER'],
-                            'password': app.config['DB_PASSWORD'],
-                            'database': app.config['DB_NAME']
-                        }
-                    
-                    # Create connection pool with configurable pool size
-                    try:
-                        pool_size = int(os.getenv('DB_POOL_SIZE', '10'))
-                        if pool_size < 1 or pool_size > 100:
-                            app.logger.warning(f"Invalid DB_POOL_SIZE {pool_size}, using default 10")
-                            pool_size = 10
-                    except (ValueError, TypeError):
-                        app.logger.warning("DB_POOL_SIZE must be a number, using default 10")
-                        pool_size = 10
-                    
-                    _connection_pool = pooling.MySQLConnectionPool(
-                        pool_name="bookstore_pool",
-                        pool_size=pool_size,
-                        pool_reset_session=True,
-                        **db_config,
-                        connect_timeout=10,
-                        autocommit=False
-                    )
-                    app.logger.info(f"MySQL connection pool created successfully with size {pool_size}")
+                    pool_size = get_pool_size('DB_WRITE_POOL_SIZE', 6)
+                    db_config = get_primary_config()
+                    _connection_pool = create_pool("bookstore_write", db_config, pool_size)
+                    if not mysql.connector.HAVE_CEXT:
+                        app.logger.warning("MySQL C extension not available, using the slower pure-Python driver")
+                    pool_monitor.start()
+                    _pool_settings['write'] = connection_settings(db_config)
+                    app.logger.info("MySQL write connection pool created successfully with size %s", pool_size)
                 except Exception as e:
-                    app.logger.error(f"Failed to create connection pool: {e}")
+                    app.logger.error("Failed to create connection pool: %s", e)
                     app.logger.error("Please check your database configuration (host, user, password, database name)")
                     # Don't set _connection_pool, let it remain None so get_db_connection can handle it
                     raise
     
     return _connection_pool
 
-# Cache for book details (expires after 5 minutes)
-_book_cache = {}
+def get_max_connections():
+    """Return the server's max_connections, or None if it can't be read"""
+    try:
+        conn = get_connection_pool().get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT @@max_connections")
+            (max_connections,) = cursor.fetchone()
+            cursor.close()
+            return max_connections
+        finally:
+            conn.close()
+    except Error as e:
+        app.logger.warning("Could not read max_connections: %s", e)
+        return None
+
+def fit_max_connections(read_pool_size, write_pool_size):
+    """Check pool sizes against the primary's max_connections, returning the read pool size to use"""
+    max_connections = get_max_connections()
+    if not max_connections:
+        return read_pool_size
+    
+    # Both pools (plus overflow) of every worker process share the primary; keep
+    # them within its connection limit
+    workers = app.config['WEB_CONCURRENCY']
+    max_overflow = app.config['DB_POOL_MAX_OVERFLOW']
+    total = workers * (read_pool_size + write_pool_size + max_overflow)
+    if total > max_connections:
+        read_pool_size = max(max_connections // workers - write_pool_size - max_overflow, 1)
+        app.logger.warning("Read pool reduced to %s to fit max_connections=%s across %s workers",
+                           read_pool_size, max_connections, workers)
+    elif total > max_connections * 0.75:
+        # Leave headroom for other clients, admin sessions and replication
+        app.logger.warning("%s workers may open %s connections, over 75%% of max_connections=%s",
+                           workers, total, max_connections)
+    return read_pool_size
+
+def get_pool_stats():
+    """Size and free connection count of each pool created so far"""
+    stats = {}
+    for kind, pool in (('write', _connection_pool), ('read', _read_pool)):
+        if pool is not None:
+            # The pool keeps its idle connections in a queue and exposes no public counter
+            available = pool._cnx_queue.qsize()
+            stats[kind] = {
+                'pool_size': pool.pool_size,
+                'available': available,
+                'in_use': pool.pool_size - available
+            }
+    return stats
+
+def get_overflow_in_use():
+    """Number of overflow connections currently open"""
+    # BoundedSemaphore keeps its free slot count in _value
+    return app.config['DB_POOL_MAX_OVERFLOW'] - _overflow_slots._value
+
+def get_read_pool():
+    """Get or create the read-only connection pool (singleton pattern).
+    
+    Uses the read replica when REPLICA_URL is set, otherwise the primary.
+    Read connections run in autocommit mode, so they hold no transaction
+    between requests and skip the per-checkout session reset.
+    """
+    global _read_pool
+    
+    if _read_pool is None:
+        write_pool_size = get_connection_pool().pool_size
+        with _pool_lock:
+            if _read_pool is None:
+                try:
+                    # DB_POOL_SIZE is the older name for the read pool size
+                    env_var = 'DB_READ_POOL_SIZE' if os.getenv('DB_READ_POOL_SIZE') else 'DB_POOL_SIZE'
+                    pool_size = get_pool_size(env_var, 25)
+                    replica_url = app.config.get('REPLICA_URL')
+                    if replica_url:
+                        db_config = parse_database_url(replica_url)
+                    else:
+                        db_config = get_primary_config()
+                        pool_size = fit_max_connections(pool_size, write_pool_size)
+                    
+                    _read_pool = create_pool("bookstore_read", db_config, pool_size,
+                                             reset_session=False, autocommit=True)
+                    _pool_settings['read'] = connection_settings(db_config, autocommit=True)
+                    app.logger.info("MySQL read connection pool created successfully with size %s", pool_size)
+                except Exception as e:
+                    app.logger.error("Failed to create read connection pool: %s", e)
+                    raise
+    
+    return _read_pool
+
+# Cache for book details (expires after 5 minutes; least recently used
+# books are evicted once it holds BOOK_CACHE_MAXSIZE entries). Entries are
+# (book, deadline) with a time.monotonic() deadline: a float compare per
+# lookup, unaffected by wall-clock changes
+_book_cache = OrderedDict()
 _cache_lock_book = threading.Lock()
 CACHE_DURATION = timedelta(minutes=5)
+CACHE_TTL_S = CACHE_DURATION.total_seconds()
+BOOK_CACHE_MAXSIZE = 1024
+
+# Striped locks so concurrent cache misses for the same book query it once,
+# while misses for different books still load in parallel
+_book_load_locks = [threading.Lock() for _ in range(64)]
+
+def book_load_lock(book_id):
+    """Lock to hold while loading a missing book into the cache"""
+    return _book_load_locks[hash(book_id) % len(_book_load_locks)]
+
+# With REDIS_URL set, all workers share one book cache in Redis instead of
+# each keeping its own copy; Redis expires the keys itself
+BOOK_KEY_PREFIX = 'bookstore:book:'
+_redis = None
+if redis is not None and app.config.get('REDIS_URL'):
+    _redis = redis.Redis.from_url(app.config['REDIS_URL'], socket_timeout=0.5,
+                                  socket_connect_timeout=0.5)
+
+def book_key(book_id):
+    """Redis key of a cached book; Bookid compares case-insensitively, so one key per book"""
+    return BOOK_KEY_PREFIX + book_id.lower()
 
 def get_cached_book(book_id):
     """Get book from cache if available and not expired"""
+    if _redis is not None:
+        try:
+            value = _redis.get(book_key(book_id))
+        except redis.RedisError as e:
+            app.logger.warning("Redis book cache unavailable: %s", e)
+            return None
+        # JSON has no tuples, so (BookName, Price, Quantity) comes back as a list
+        return tuple(app.json.loads(value)) if value is not None else None
+    
+    # Single OrderedDict operations are atomic under the GIL, so hits are read
+    # without the lock and concurrent readers never wait on each other
+    entry = _book_cache.get(book_id)
+    if entry is None:
+        return None
+    
+    book, deadline = entry
+    if time.monotonic() < deadline:
+        # Refresh the LRU position only if nobody holds the lock; a skipped
+        # refresh just makes eviction order slightly less exact
+        if _cache_lock_book.acquire(blocking=False):
+            try:
+                if book_id in _book_cache:
+                    _book_cache.move_to_end(book_id)
+            finally:
+                _cache_lock_book.release()
+        return book
+    
+    # Cache expired, remove it (unless another thread has just refreshed it)
     with _cache_lock_book:
-        if book_id in _book_cache:
-            book, timestamp = _book_cache[book_id]
-            if datetime.now() - timestamp < CACHE_DURATION:
-                return book
-            else:
-                # Cache expired, remove it
-                del _book_cache[book_id]
+        if _book_cache.get(book_id) is entry:
+            del _book_cache[book_id]
     return None
 
+def get_cached_books(book_ids):
+    """Get the cached books among book_ids as a dict (one Redis round trip)"""
+    if _redis is not None:
+        try:
+            values = _redis.mget([book_key(book_id) for book_id in book_ids])
+        except redis.RedisError as e:
+            app.logger.warning("Redis book cache unavailable: %s", e)
+            return {}
+        return {book_id: tuple(app.json.loads(value))
+                for book_id, value in zip(book_ids, values) if value is not None}
+    
+    books = {}
+    for book_id in book_ids:
+        book = get_cached_book(book_id)
+        if book:
+            books[book_id] = book
+    return books
+
 def cache_book(book_id, book_data):
-    """Store book in cache"""
+    """Store book in cache, evicting the least recently used books when full"""
+    if _redis is not None:
+        try:
+            _redis.set(book_key(book_id), app.json.dumps(book_data),
+                       ex=int(CACHE_TTL_S))
+        except redis.RedisError as e:
+            app.logger.warning("Redis book cache unavailable: %s", e)
+        return
+    
+    with _cache_lock_book:
+        _book_cache[book_id] = (book_data, time.monotonic() + CACHE_TTL_S)
+        _book_cache.move_to_end(book_id)
+        while len(_book_cache) > BOOK_CACHE_MAXSIZE:
+            _book_cache.popitem(last=False)
+
+def cache_books_bulk(books):
+    """Store many (book_id, book_data) pairs with one lock acquisition (or one Redis round trip)"""
+    if _redis is not None:
+        ttl = int(CACHE_TTL_S)
+        try:
+            with _redis.pipeline(transaction=False) as pipe:
+                for book_id, book_data in books:
+                    pipe.set(book_key(book_id), app.json.dumps(book_data), ex=ttl)
+                pipe.execute()
+        except redis.RedisError as e:
+            app.logger.warning("Redis book cache unavailable: %s", e)
+        return
+    
+    deadline = time.monotonic() + CACHE_TTL_S
     with _cache_lock_book:
-        _book_cache[book_id] = (book_data, datetime.now())
+        for book_id, book_data in books:
+            _book_cache[book_id] = (book_data, deadline)
+            _book_cache.move_to_end(book_id)
+        while len(_book_cache) > BOOK_CACHE_MAXSIZE:
+            _book_cache.popitem(last=False)
 
-def clear_book_cache():
-    """Clear all cached books (call when stock is updated)"""
+def clear_book_cache(book_ids=None):
+    """Clear cached books (call when stock is updated).
+    
+    With Redis only the given book_ids are deleted, so a write costs one DEL
+    rather than a scan of the keyspace; None clears every book.
+    """
+    global _book_cache
+    if _redis is not None:
+        try:
+            if book_ids is None:
+                keys = list(_redis.scan_iter(match=BOOK_KEY_PREFIX + '*', count=500))
+            else:
+                keys = [book_key(book_id) for book_id in book_ids]
+            if keys:
+                _redis.delete(*keys)
+        except redis.RedisError as e:
+            app.logger.warning("Redis book cache unavailable: %s", e)
+        return
+    
+    # Swap in an empty cache rather than deleting every entry while holding the
+    # lock; the old one is freed once in-flight lock-free reads let go of it
     with _cache_lock_book:
-        _book_cache.clear()
+        _book_cache = OrderedDict()
+
+# Number of books per page on /stock and transactions per page on /sales
+PER_PAGE = 50
+
+# Cache for dashboard stats and the /sales grand totals (expires after 30 seconds)
+_stats_cache = {'data': None, 'timestamp': None}
+_sales_totals_cache = {'data': None, 'timestamp': None}
+_cache_lock_stats = threading.Lock()
+STATS_CACHE_DURATION = timedelta(seconds=30)
+
+def get_cached_stats():
+    """Get dashboard stats from cache if available and not expired"""
+    with _cache_lock_stats:
+        if _stats_cache['data'] is not None:
+            if datetime.now() - _stats_cache['timestamp'] < STATS_CACHE_DURATION:
+                return dict(_stats_cache['data'])
+            _stats_cache['data'] = None
+    return None
+
+def cache_stats(stats):
+    """Store dashboard stats in cache"""
+    with _cache_lock_stats:
+        _stats_cache['data'] = dict(stats)
+        _stats_cache['timestamp'] = datetime.now()
+
+def get_cached_sales_totals():
+    """Get the (total_sales, total_transactions) shown on /sales if cached and not expired"""
+    with _cache_lock_stats:
+        if _sales_totals_cache['data'] is not None:
+            if datetime.now() - _sales_totals_cache['timestamp'] < STATS_CACHE_DURATION:
+                return _sales_totals_cache['data']
+            _sales_totals_cache['data'] = None
+    return None
+
+def cache_sales_totals(totals):
+    """Store the /sales grand totals in cache"""
+    with _cache_lock_stats:
+        _sales_totals_cache['data'] = tuple(totals)
+        _sales_totals_cache['timestamp'] = datetime.now()
+
+def clear_stats_cache():
+    """Clear cached dashboard stats and sales totals (call when books or sales change)"""
+    with _cache_lock_stats:
+        _stats_cache['data'] = None
+        _sales_totals_cache['data'] = None
+
+# Encoded, gzipped /api/books/all body, stored per catalog version; a write bumps the
+# version, so stale bodies are never read again (in Redis they just expire).
+# Locally the body lives in one immutable (version, body, deadline) tuple: readers
+# take a single reference without the lock, writers replace the whole tuple under
+# it. Without Redis a write in another worker doesn't bump this worker's version,
+# so the body also expires after CACHE_DURATION like the book cache
+CATALOG_VERSION_KEY = 'bookstore:books_version'
+CATALOG_KEY_PREFIX = 'bookstore:books_all:v'
+_catalog_version = 0
+_catalog_snapshot = (None, None, 0)
+_cache_lock_catalog = threading.Lock()
+
+def get_catalog_version():
+    """Current catalog version, or None if Redis can't be reached"""
+    if _redis is not None:
+        try:
+            return int(_redis.get(CATALOG_VERSION_KEY) or 0)
+        except redis.RedisError as e:
+            app.logger.warning("Redis book cache unavailable: %s", e)
+            return None
+    return _catalog_version
+
+def get_cached_catalog(version):
+    """Get the encoded catalog for this version if it has been cached"""
+    if _redis is not None:
+        try:
+            return _redis.get(CATALOG_KEY_PREFIX + str(version))
+        except redis.RedisError as e:
+            app.logger.warning("Redis book cache unavailable: %s", e)
+            return None
+    cached_version, body, deadline = _catalog_snapshot
+    if cached_version == version and time.monotonic() < deadline:
+        return body
+    return None
+
+def cache_catalog(version, body, replace=False):
+    """Store the encoded catalog built while this version was current.
+    
+    By default a body already cached for the version is kept; the background
+    refresher passes replace=True to swap in a fresh one and restart its TTL.
+    """
+    global _catalog_snapshot
+    if _redis is not None:
+        try:
+            _redis.set(CATALOG_KEY_PREFIX + str(version), body,
+                       ex=int(CACHE_TTL_S), nx=not replace)
+        except redis.RedisError as e:
+            app.logger.warning("Redis book cache unavailable: %s", e)
+        return
+    with _cache_lock_catalog:
+        # A write may have bumped the version while this body was being built
+        if _catalog_version == version and (replace or get_cached_catalog(version) is None):
+            _catalog_snapshot = (version, body, time.monotonic() + CACHE_TTL_S)
+
+def bump_catalog_version():
+    """Invalidate the cached catalog (every worker sees the new version through Redis)"""
+    global _catalog_version, _catalog_snapshot
+    if _redis is not None:
+        try:
+            _redis.incr(CATALOG_VERSION_KEY)
+        except redis.RedisError as e:
+            app.logger.warning("Redis book cache unavailable: %s", e)
+        return
+    with _cache_lock_catalog:
+        _catalog_version += 1
+        _catalog_snapshot = (None, None, 0)
+
+def invalidate_caches(book_ids=None):
+    """Clear every cache derived from Available_Books or Sales (call after any write to them)"""
+    clear_book_cache(book_ids)
+    bump_catalog_version()
+    clear_stats_cache()
+    catalog_refresher.trigger()
+
+# Cache for user lookups in load_user (expires after 5 minutes)
+_user_cache = {}
+_cache_lock_user = threading.Lock()
+USER_CACHE_DURATION = timedelta(minutes=5)
+
+def get_cached_user(username):
+    """Get cached existence flag for a user, or None if not cached/expired"""
+    with _cache_lock_user:
+        if username in _user_cache:
+            exists, timestamp = _user_cache[username]
+            if datetime.now() - timestamp < USER_CACHE_DURATION:
+                return exists
+            else:
+                del _user_cache[username]
+    return None
+
+def cache_user(username, exists):
+    """Store whether a user exists in cache"""
+    with _cache_lock_user:
+        _user_cache[username] = (exists, datetime.now())
+
+def invalidate_cached_user(username):
+    """Drop a cached user lookup (call when the signup table changes)"""
+    with _cache_lock_user:
+        _user_cache.pop(username, None)
+
+class BatchingUserLookup:
+    """Coalesce concurrent signup lookups into a single SELECT ... WHERE username IN (...)"""
+    
+    def __init__(self, max_batch=32, max_wait=0.01):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+    
+    def lookup(self, username, timeout=5):
+        """Return the signup row (username, password) for username, or None if not found"""
+        item = {'username': username, 'done': threading.Event(), 'result': None, 'error': None}
+        self._ensure_worker()
+        self._pending.put(item)
+        
+        if not item['done'].wait(timeout):
+            raise Error(msg='Timed out waiting for user lookup')
+        if item['error']:
+            raise item['error']
+        return item['result']
+    
+    def _ensure_worker(self):
+        """Start the background batching thread on first use"""
+        if self._worker is None:
+            with self._worker_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, daemon=True)
+                    self._worker.start()
+    
+    def _run(self):
+        """Collect up to max_batch lookups or wait max_wait seconds, then query once"""
+        while True:
+            batch = [self._pending.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            # _process answers every caller itself; this only keeps the thread
+            # alive, since nothing restarts it and later lookups would time out
+            try:
+                self._process(batch)
+            except Exception as e:
+                app.logger.error("Batched user lookup worker error: %s", e)
+    
+    def _process(self, batch):
+        """Run one query for the whole batch and hand each caller its row"""
+        usernames = list({item['username'] for item in batch})
+        try:
+            conn = get_db_connection()
+            if not conn:
+                raise Error(msg='Database connection error')
+            try:
+                cursor = conn.cursor(dictionary=True)
+                placeholders = ', '.join(['%s'] * len(usernames))
+                cursor.execute(f"SELECT username, password FROM signup WHERE username IN ({placeholders})",
+                               tuple(usernames))
+                # Usernames compare case-insensitively in MySQL, so match them the same way
+                rows = {row['username'].lower(): row for row in cursor.fetchall()}
+                cursor.close()
+            finally:
+                conn.close()
+            
+            for item in batch:
+                item['result'] = rows.get(item['username'].lower())
+        except Exception as e:
+            # Any failure must reach the callers as an error: a None result
+            # would tell them (and load_user's cache) that the users don't exist
+            app.logger.error("Error in batched user lookup: %s", e)
+            error = e if isinstance(e, Error) else Error(msg=f'User lookup failed: {e}')
+            for item in batch:
+                item['error'] = error
+        finally:
+            for item in batch:
+                item['done'].set()
+
+user_lookup = BatchingUserLookup()
+
+# Slots for overflow connections, shared by both pools
+_overflow_slots = threading.BoundedSemaphore(app.config['DB_POOL_MAX_OVERFLOW'])
+
+# Times each pool was found exhausted, whether or not overflow absorbed it
+_pool_exhausted_total = {'read': 0, 'write': 0}
+_pool_exhausted_lock = threading.Lock()
+
+def count_pool_exhausted(kind):
+    """Record that the read or write pool had no free connection"""
+    with _pool_exhausted_lock:
+        _pool_exhausted_total[kind] += 1
+
+def open_overflow_connection(kind):
+    """Open a temporary unpooled connection, or return None if no overflow slot is free"""
+    if kind not in _pool_settings or not _overflow_slots.acquire(blocking=False):
+        return None
+    try:
+        conn = mysql.connector.connect(**_pool_settings[kind])
+    except Error:
+        _overflow_slots.release()
+        raise
+    conn.is_overflow = True
+    return conn
+
+def release_connection(conn):
+    """Return a pooled connection to its pool, or close an overflow connection"""
+    try:
+        conn.close()
+    finally:
+        if getattr(conn, 'is_overflow', False) is True:
+            _overflow_slots.release()
+
+class PoolMonitor:
+    """Log connection pool utilization periodically and warn on sustained saturation"""
+    
+    def __init__(self, interval=30, threshold=0.8, samples=3):
+        self.interval = interval
+        self.threshold = threshold
+        self.samples = samples
+        self._high_samples = {}
+        self._lock = threading.Lock()
+        self._worker = None
+    
+    def start(self):
+        """Start the sampling thread if it isn't running yet"""
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='pool-monitor', daemon=True)
+                self._worker.start()
+    
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.sample()
+    
+    def sample(self):
+        """Log each pool's utilization, warning once it stays high for several samples"""
+        for kind, stats in get_pool_stats().items():
+            utilization = stats['in_use'] / stats['pool_size']
+            if utilization >= self.threshold:
+                self._high_samples[kind] = self._high_samples.get(kind, 0) + 1
+            else:
+                self._high_samples[kind] = 0
+            
+            if self._high_samples[kind] >= self.samples:
+                app.logger.warning("%s pool utilization %.2f for %d consecutive samples",
+                                   kind, utilization, self._high_samples[kind])
+            else:
+                app.logger.info("%s pool util=%.2f", kind, utilization)
+
+pool_monitor = PoolMonitor()
 
 # Database connection function with retry logic
-def get_db_connection(retries=3):
-    """Get a connection from the pool with retry logic"""
-    pool = get_connection_pool()
+def get_db_connection(retries=3, kind='write', overflow=False):
+    """Get a connection from the read or write pool with retry logic.
     
+    With overflow=True an exhausted pool falls back to a temporary unpooled
+    connection; the caller must hand it to release_connection().
+    """
+    backoff = 0.05
     for attempt in range(retries):
         try:
-            connection = pool.get_connection()
-            return connection
-        except Exception as e:
-            if attempt < retries - 1:
-                time.sleep(0.5)  # Short delay before retry
+            # Pool is created lazily on first use so create_database() can
+            # run before it exists; a failed creation is retried here too
+            pool = get_read_pool() if kind == 'read' else get_connection_pool()
+            try:
+                return pool.get_connection()
+            except PoolError:
+                count_pool_exhausted(kind)
+                connection = open_overflow_connection(kind) if overflow else None
+                if connection is None:
+                    raise
+                return connection
+        except Error as e:
+            # An exhausted pool gets a single retry; more would only lengthen the queue
+            exhausted = isinstance(e, PoolError) and attempt >= 1
+            if attempt < retries - 1 and not exhausted:
+                # Exponential backoff with jitter (~50ms, ~150ms, ...) so callers fail fast
+                time.sleep(backoff + random.random() * backoff)
+                backoff *= 3
                 continue
             else:
-                app.logger.error(f"Failed to get connection from pool: {e}")
+                app.logger.error("Failed to get connection from %s pool: %s", kind, e)
                 return None
 
+def get_db():
+    """Get the write connection for the current request, acquiring it on first use"""
+    if 'db' not in g:
+        g.db = get_db_connection(overflow=True)
+    return g.db
+
+# Reads right after a user's own write go to the write connection so replica
+# lag (or an earlier snapshot) can't hide it
+REPLICA_LAG_WINDOW = 1.0
+
+def mark_write():
+    """Record that the current user just wrote to the primary"""
+    session['last_write_at'] = time.time()
+
+def get_read_db():
+    """Get a connection for read-only queries from the read pool, else the write connection"""
+    if g.get('db') is not None or time.time() - session.get('last_write_at', 0) < REPLICA_LAG_WINDOW:
+        return get_db()
+    
+    if 'read_db' not in g:
+        g.read_db = get_db_connection(kind='read', overflow=True)
+        if g.read_db is None:
+            app.logger.error("Read pool unavailable, using write pool")
+    return g.read_db or get_db()
+
+def is_replica_connection(conn):
+    """Whether conn reads from the replica, which may not have other users' latest writes yet.
+    
+    Rows read there must not go into the shared caches: right after a sale's
+    invalidation they would put the old stock back for everyone.
+    """
+    return bool(app.config.get('REPLICA_URL')) and conn is g.get('read_db')
+
+@app.teardown_appcontext
+def close_db(exc):
+    """Return the request's connections to their pools, rolling back if the request failed"""
+    for key in ('db', 'read_db'):
+        conn = g.pop(key, None)
+        if conn is not None:
+            if exc is not None:
+                try:
+                    conn.rollback()
+                except Error:
+                    pass
+            release_connection(conn)
+
+class DatabaseUnavailable(Error):
+    """Raised by db_conn() when no pooled connection could be obtained"""
+
+@contextmanager
+def db_conn(dictionary=False, read_only=False, prepared=False):
+    """Yield (conn, cursor) on the request's pooled connection.
+    
+    The cursor is always closed and the transaction is rolled back if the block
+    raises; the connection itself goes back to the pool in close_db().
+    
+    prepared=True gives a server-side prepared cursor. mysql-connector prepares
+    each statement per cursor and deallocates it when the cursor closes (and
+    pool_reset_session drops it on checkin), so it only pays off when one block
+    executes the same statement many times. For a single execute it adds a
+    PREPARE and a CLOSE round trip, which is why the routes don't use it.
+    """
+    conn = get_read_db() if read_only else get_db()
+    if conn is None:
+        raise DatabaseUnavailable(msg='Database connection error. Please try again.')
+    
+    cursor = conn.cursor(dictionary=dictionary, prepared=prepared)
+    try:
+        yield conn, cursor
+    except Exception:
+        try:
+            conn.rollback()
+        except Error:
+            pass
+        raise
+    finally:
+        cursor.close()
+
 def create_database():
     """Create database if it doesn't exist"""
     try:
@@ -206,6 +910,23 @@ def create_database():
         print(f"Error creating database: {e}")
         sys.exit(1)
 
+def normalize_sale_dates(cursor):
+    """Give every row of a transaction its first row's SaleDate; returns the rows changed.
+    
+    sell() used to insert a transaction's rows one statement at a time, so a
+    multi-book sale could straddle a second boundary. /sales groups by
+    (SaleDate, transaction_id) and relies on one SaleDate per transaction.
+    """
+    cursor.execute("""
+        UPDATE Sales s
+        JOIN (SELECT transaction_id, MIN(SaleDate) AS first_date FROM Sales
+              GROUP BY transaction_id HAVING MIN(SaleDate) <> MAX(SaleDate)) t
+          ON s.transaction_id = t.transaction_id
+        SET s.SaleDate = t.first_date
+        WHERE s.SaleDate <> t.first_date
+    """)
+    return cursor.rowcount
+
 def init_db():
     """Initialize database tables"""
     create_database()
@@ -218,6 +939,15 @@ def init_db():
     cursor = conn.cursor()
     
     try:
+        # Only one process at a time runs the DDL below; when several workers or
+        # instances boot together the others skip it instead of queueing on
+        # metadata locks behind the winner
+        cursor.execute("SELECT GET_LOCK('bookstore_init', 0)")
+        (got_lock,) = cursor.fetchone()
+        if not got_lock:
+            print("Database initialization already running in another process, skipping.")
+            return
+        
         # Create signup table
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS signup (
@@ -235,7 +965,9 @@ def init_db():
                 Quantity INT NOT NULL DEFAULT 0,
                 Author VARCHAR(20),
                 Publication VARCHAR(30),
-                Price INT NOT NULL
+                Price INT NOT NULL,
+                INDEX idx_books_genre_name (Genre, BookName),
+                INDEX idx_books_qty_covering (Quantity, BookName, Price)
             )
         """)
         
@@ -252,12 +984,18 @@ def init_db():
                 Price INT NOT NULL,
                 SaleDate TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (Bookid) REFERENCES Available_Books(Bookid) ON DELETE SET NULL,
-                INDEX idx_transaction (transaction_id)
+                INDEX idx_sales_date (SaleDate DESC, transaction_id DESC),
+                INDEX idx_sales_totals (transaction_id, Quantity, Price)
             )
         """)
         
         # Check if transaction_id column exists in existing Sales table
-        cursor.execute("SHOW COLUMNS FROM Sales LIKE 'transaction_id'")
+        # (information_schema avoids the metadata lock SHOW COLUMNS takes)
+        cursor.execute("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = DATABASE() AND table_name = 'Sales'
+              AND column_name = 'transaction_id'
+        """)
         result = cursor.fetchone()
         
         # If transaction_id doesn't exist, add it
@@ -268,21 +1006,50 @@ def init_db():
                 ADD COLUMN transaction_id VARCHAR(50) NOT NULL DEFAULT '' AFTER id
             """)
             
-            # Add index for transaction_id
-            cursor.execute("""
-                ALTER TABLE Sales 
-                ADD INDEX idx_transaction (transaction_id)
-            """)
-            
             # Update existing records with legacy transaction IDs
             cursor.execute("""
                 UPDATE Sales 
                 SET transaction_id = CONCAT('TXN-LEGACY-', LPAD(id, 6, '0'))
                 WHERE transaction_id = '' OR transaction_id IS NULL
             """)
+            # idx_sales_totals (transaction_id, ...) is added below, after the
+            # UPDATE, so it is built once from the final values
             print("Transaction ID column added successfully.")
         
+        # Add indexes for ORDER BY/WHERE clauses to tables created before they existed
+        # (MySQL has no CREATE INDEX IF NOT EXISTS)
+        indexes = {
+            'idx_books_genre_name': ('Available_Books', '(Genre, BookName)'),
+            # Serves /api/books/all (Quantity > 0) from the index alone; InnoDB
+            # appends the Bookid primary key to every secondary index entry
+            'idx_books_qty_covering': ('Available_Books', '(Quantity, BookName, Price)'),
+            'idx_sales_date': ('Sales', '(SaleDate DESC, transaction_id DESC)'),
+            # Covers the SUM/COUNT totals on /sales and /dashboard without reading rows
+            'idx_sales_totals': ('Sales', '(transaction_id, Quantity, Price)')
+        }
+        cursor.execute("""
+            SELECT DISTINCT INDEX_NAME FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND table_name IN ('Available_Books', 'Sales')
+        """)
+        existing_indexes = {row[0] for row in cursor.fetchall()}
+        for index_name, (table, columns) in indexes.items():
+            if index_name not in existing_indexes:
+                print(f"Adding index {index_name} to {table} table...")
+                cursor.execute(f"ALTER TABLE {table} ADD INDEX {index_name} {columns}")
+        
+        # Older schemas also indexed transaction_id alone; idx_sales_totals starts
+        # with it and serves the same lookups, so that index is only insert overhead
+        if 'idx_transaction' in existing_indexes:
+            print("Dropping redundant index idx_transaction from Sales table...")
+            cursor.execute("ALTER TABLE Sales DROP INDEX idx_transaction, ALGORITHM=INPLACE, LOCK=NONE")
+        
+        updated = normalize_sale_dates(cursor)
+        if updated:
+            print(f"Aligned SaleDate of {updated} sales rows with their transactions.")
+        
         conn.commit()
+        cursor.execute("SELECT RELEASE_LOCK('bookstore_init')")
+        cursor.fetchone()
         print("Database tables initialized successfully.")
         
     except Error as e:
@@ -290,8 +1057,46 @@ def init_db():
         sys.exit(1)
     finally:
         cursor.close()
+        # Returning the connection resets its session, which also drops the lock
         conn.close()
 
+@app.cli.command('init-db')
+def init_db_command():
+    """Create the database, tables and indexes (run once per deploy)"""
+    init_db()
+
+def run_blocking(func, *args):
+    """Run a CPU-heavy call (password hashing) on a real OS thread when under gevent"""
+    # Under gunicorn's gevent worker the hash would otherwise block every greenlet;
+    # the hub's threadpool runs it on a native thread while other greenlets proceed
+    monkey = sys.modules.get('gevent.monkey')
+    if monkey is not None and monkey.is_module_patched('threading'):
+        from gevent import get_hub
+        return get_hub().threadpool.apply(func, args)
+    return func(*args)
+
+def upgrade_password_hash(username, password):
+    """Re-hash a user's password with the current default method after a successful login"""
+    # Hash before taking a connection so it isn't held idle for the whole KDF
+    hashed_password = run_blocking(generate_password_hash, password)
+    try:
+        with db_conn() as (conn, cursor):
+            cursor.execute("UPDATE signup SET password = %s WHERE username = %s",
+                           (hashed_password, username))
+            conn.commit()
+    except Error as e:
+        app.logger.error("Error upgrading password hash: %s", e)
+
+def stream_page(template_name, **context):
+    """Stream a rendered template so the page head is sent before the table body is rendered"""
+    # base.html pops flashed messages; do it now so the session change is saved
+    # before the response headers go out (the template reuses the popped list)
+    get_flashed_messages()
+    # The rows are already fetched; release the DB connection instead of holding it
+    # until the client has downloaded the whole page
+    close_db(None)
+    return Response(stream_template(template_name, **context), mimetype='text/html')
+
 # Routes
 
 @app.route('/')
@@ -299,19 +1104,52 @@ def index():
     """Home page"""
     return render_template('index.html')
 
+# Time of the last successful health check
+_last_healthy_check = None
+HEALTH_CHECK_CACHE_DURATION = timedelta(seconds=10)
+
+# Share of a pool's connections in use above which /health reports "degraded"
+POOL_SATURATION_THRESHOLD = 0.9
+
 @app.route('/health')
 def health_check():
     """Health check endpoint for deployment monitoring"""
-    try:
-        conn = get_db_connection()
-        if conn:
-            conn.close()
-            return jsonify({'status': 'healthy', 'database': 'connected'}), 200
-        else:
-            return jsonify({'status': 'unhealthy', 'database': 'disconnected'}), 503
-    except Exception as e:
-        app.logger.error(f"Health check failed: {e}")
-        return jsonify({'status': 'unhealthy', 'error': str(e)}), 503
+    global _last_healthy_check
+    
+    status = 'healthy'
+    # Probes fire every few seconds; only ping the database when the last
+    # successful ping is older than HEALTH_CHECK_CACHE_DURATION
+    if not _last_healthy_check or datetime.now() - _last_healthy_check >= HEALTH_CHECK_CACHE_DURATION:
+        try:
+            # Single ping on a pooled connection, without get_db_connection's retry delays
+            conn = get_connection_pool().get_connection()
+            try:
+                conn.ping(reconnect=False, attempts=1, delay=0)
+            finally:
+                conn.close()
+            _last_healthy_check = datetime.now()
+        except PoolError:
+            # Every connection is checked out: the database is up but the pool is saturated
+            status = 'degraded'
+        except Exception as e:
+            app.logger.error("Health check failed: %s", e)
+            return jsonify({'status': 'unhealthy', 'error': str(e)}), 503
+    
+    pools = get_pool_stats()
+    if any(stats['in_use'] > stats['pool_size'] * POOL_SATURATION_THRESHOLD for stats in pools.values()):
+        status = 'degraded'
+    return jsonify({'status': status, 'database': 'connected', 'pools': pools}), 200
+
+@app.route('/admin/pool-stats')
+@login_required
+def pool_stats():
+    """Connection pool usage for capacity planning"""
+    return jsonify({
+        'pools': get_pool_stats(),
+        'overflow_in_use': get_overflow_in_use(),
+        'max_overflow': app.config['DB_POOL_MAX_OVERFLOW'],
+        'pool_exhausted_total': dict(_pool_exhausted_total)
+    })
 
 @app.route('/signup', methods=['GET', 'POST'])
 def signup():
@@ -335,23 +1173,24 @@ def signup():
             return render_template('signup.html')
         
         # Hash password
-        hashed_password = generate_password_hash(password)
+        hashed_password = run_blocking(generate_password_hash, password)
         
         # Insert into database
-        conn = get_db_connection()
-        if not conn:
-            flash('Database connection error. Please try again.', 'error')
-            return render_template('signup.html')
-        
         try:
-            cursor = conn.cursor()
-            cursor.execute("INSERT INTO signup (username, password) VALUES (%s, %s)", 
-                         (username, hashed_password))
-            conn.commit()
-            cursor.close()
-            conn.close()
+            with db_conn() as (conn, cursor):
+                cursor.execute("INSERT INTO signup (username, password) VALUES (%s, %s)", 
+                             (username, hashed_password))
+                conn.commit()
+            mark_write()
+            
+            # Drop any cached "user does not exist" entry
+            invalidate_cached_user(username)
+            
             flash('Account created successfully! Please log in.', 'success')
             return redirect(url_for('login'))
+        except DatabaseUnavailable as e:
+            flash(e.msg, 'error')
+            return render_template('signup.html')
         except Error as e:
             if 'Duplicate entry' in str(e):
                 flash('Username already exists. Please choose another.', 'error')
@@ -372,19 +1211,27 @@ def login():
             flash('Username and password are required.', 'error')
             return render_template('login.html')
         
-        conn = get_db_connection()
-        if not conn:
-            flash('Database connection error. Please try again.', 'error')
-            return render_template('login.html')
-        
         try:
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute("SELECT * FROM signup WHERE username = %s", (username,))
-            user = cursor.fetchone()
-            cursor.close()
-            conn.close()
+            if app.config['ENABLE_LOGIN_BATCHING']:
+                # Coalesced with other concurrent logins into one SELECT
+                user = user_lookup.lookup(username)
+                password_hash = user['password'] if user else None
+            else:
+                with db_conn() as (conn, cursor):
+                    cursor.execute("SELECT password FROM signup WHERE username = %s", (username,))
+                    row = cursor.fetchone()
+                password_hash = row[0] if row else None
+                # Give the connection back before the slow hash check below
+                close_db(None)
             
-            if user and check_password_hash(user['password'], password):
+            if password_hash and run_blocking(check_password_hash, password_hash, password):
+                # Upgrade legacy pbkdf2 hashes to werkzeug's current default (scrypt)
+                if password_hash.startswith('pbkdf2:'):
+                    upgrade_password_hash(username, password)
+                
+                # The user was just verified, so later load_user calls can skip the DB
+                cache_user(username, True)
+                
                 user_obj = User(username)
                 login_user(user_obj)
                 flash(f'Welcome back, {username}!', 'success')
@@ -392,6 +1239,9 @@ def login():
             else:
                 flash('Invalid username or password.', 'error')
                 return render_template('login.html')
+        except DatabaseUnavailable as e:
+            flash(e.msg, 'error')
+            return render_template('login.html')
         except Error as e:
             flash('An error occurred. Please try again.', 'error')
             return render_template('login.html')
@@ -410,42 +1260,40 @@ def logout():
 @login_required
 def dashboard():
     """Main dashboard after login"""
-    conn = get_db_connection()
+    # Stats only change on sell/add/update, so serve them from cache when fresh
+    cached_stats = get_cached_stats()
+    if cached_stats:
+        return render_template('dashboard.html', stats=cached_stats)
+    
     stats = {
         'total_books': 0,
         'total_sales': 0,
         'low_stock': 0
     }
     
-    if conn:
-        try:
-            cursor = conn.cursor()
-            
-            # Get total books count
-            cursor.execute("SELECT COUNT(*) FROM Available_Books")
-            stats['total_books'] = cursor.fetchone()[0]
-            
-            # Get total sales amount
-            cursor.execute("SELECT COALESCE(SUM(Price * Quantity), 0) FROM Sales")
-            stats['total_sales'] = cursor.fetchone()[0]
-            
-            # Get low stock count (less than 10)
-            cursor.execute("SELECT COUNT(*) FROM Available_Books WHERE Quantity < 10")
-            stats['low_stock'] = cursor.fetchone()[0]
-            
-            cursor.close()
-            conn.close()
-        except Error as e:
-            print(f"Error fetching stats: {e}")
+    try:
+        with db_conn(read_only=True) as (conn, cursor):
+            # Get total books, total sales amount and low stock count (less than 10)
+            # in a single round trip
+            cursor.execute("""
+                SELECT (SELECT COUNT(*) FROM Available_Books),
+                       (SELECT COALESCE(SUM(Price * Quantity), 0) FROM Sales),
+                       (SELECT COUNT(*) FROM Available_Books WHERE Quantity < 10)
+            """)
+            stats['total_books'], stats['total_sales'], stats['low_stock'] = cursor.fetchone()
+        cache_stats(stats)
+    except Error as e:
+        print(f"Error fetching stats: {e}")
     
     return render_template('dashboard.html', stats=stats)
 
+class SaleRejected(Exception):
+    """Raised inside a sale's transaction to roll it back and show the message to the user"""
+
 @app.route('/sell', methods=['GET', 'POST'])
 @login_required
 def sell():
     """Sell books interface"""
-    conn = get_db_connection()
-    
     if request.method == 'POST':
         customer_name = request.form.get('customer_name', '').strip()
         phone_number = request.form.get('phone_number', '').strip()
@@ -466,138 +1314,155 @@ def sell():
         # Generate unique transaction ID
         transaction_id = f"TXN-{datetime.now().strftime('%Y%m%d%H%M%S')}-{random.randint(1000, 9999)}"
         
-        if not conn:
-            flash('Database connection error. Please try again.', 'error')
-            return redirect(url_for('sell'))
-        
-        try:
-            cursor = conn.cursor(dictionary=True)
-            total_amount = 0
-            books_to_sell = []
-            
-            # Filter out empty book entries and check for duplicates
-            valid_book_ids = []
-            valid_quantities = []
-            for book_id, quantity in zip(book_ids, quantities):
-                if book_id and book_id.strip() and quantity and quantity.strip():
-                    book_id = book_id.strip()
-                    if book_id in valid_book_ids:
-                        flash(f'Duplicate book ID {book_id} detected. Each book can only be added once per transaction.', 'error')
-                        cursor.close()
-                        conn.close()
-                        return redirect(url_for('sell'))
-                    valid_book_ids.append(book_id)
-                    valid_quantities.append(quantity.strip())
-            
-            if not valid_book_ids:
-                flash('At least one book is required.', 'error')
-                cursor.close()
-                conn.close()
-                return redirect(url_for('sell'))
-            
-            # Validate all books first
-            for book_id, quantity in zip(valid_book_ids, valid_quantities):
+        # Filter out empty book entries and check for duplicates
+        # (Bookid comparisons in MySQL are case-insensitive, so these are too)
+        valid_book_ids = []
+        valid_quantities = []
+        seen_ids = set()
+        for book_id, quantity in zip(book_ids, quantities):
+            if book_id and book_id.strip() and quantity and quantity.strip():
+                book_id = book_id.strip()
+                if book_id.lower() in seen_ids:
+                    flash(f'Duplicate book ID {book_id} detected. Each book can only be added once per transaction.', 'error')
+                    return redirect(url_for('sell'))
                 try:
                     quantity = int(quantity)
                     if quantity <= 0:
                         flash(f'Quantity for Book ID {book_id} must be greater than 0.', 'error')
-                        cursor.close()
-                        conn.close()
                         return redirect(url_for('sell'))
                 except ValueError:
                     flash(f'Invalid quantity for Book ID {book_id}.', 'error')
-                    cursor.close()
-                    conn.close()
                     return redirect(url_for('sell'))
+                seen_ids.add(book_id.lower())
+                valid_book_ids.append(book_id)
+                valid_quantities.append(quantity)
+        
+        if not valid_book_ids:
+            flash('At least one book is required.', 'error')
+            return redirect(url_for('sell'))
+        
+        try:
+            total_amount = 0
+            books_to_sell = []
+            placeholders = ', '.join(['%s'] * len(valid_book_ids))
+            
+            with db_conn() as (conn, cursor):
+                # Anything read earlier in this request (e.g. by load_user) must not
+                # leave a transaction open on this connection
+                if conn.in_transaction:
+                    conn.rollback()
+                # The FOR UPDATE locks below already read the latest rows; READ
+                # COMMITTED avoids gap locks on the IN lookup, so fewer deadlocks
+                conn.start_transaction(isolation_level='READ COMMITTED')
                 
-                # Check stock
-                cursor.execute("SELECT * FROM Available_Books WHERE Bookid = %s", (book_id,))
-                book = cursor.fetchone()
+                # Check stock for the whole cart in one query, locking the rows
+                # until commit so concurrent sales can't oversell
+                cursor.execute(f"""
+                    SELECT Bookid, BookName, Quantity, Price FROM Available_Books
+                    WHERE Bookid IN ({placeholders}) FOR UPDATE
+                """, tuple(valid_book_ids))
+                stock = {row[0].lower(): row for row in cursor.fetchall()}
                 
-                if not book:
-                    flash(f'Book ID {book_id} not found.', 'error')
-                    cursor.close()
-                    conn.close()
-                    return redirect(url_for('sell'))
+                # Validate all books first
+                for book_id, quantity in zip(valid_book_ids, valid_quantities):
+                    book = stock.get(book_id.lower())
+                    
+                    if not book:
+                        raise SaleRejected(f'Book ID {book_id} not found.')
+                    
+                    stored_id, book_name, available, price = book
+                    if available < quantity:
+                        raise SaleRejected(f'Insufficient stock for {book_name}. Available: {available}, Requested: {quantity}')
+                    
+                    books_to_sell.append({
+                        'book_id': stored_id,
+                        'book_name': book_name,
+                        'quantity': quantity,
+                        'price': price
+                    })
+                    total_amount += price * quantity
                 
-                if book['Quantity'] < quantity:
-                    flash(f'Insufficient stock for {book["BookName"]}. Available: {book["Quantity"]}, Requested: {quantity}', 'error')
-                    cursor.close()
-                    conn.close()
-                    return redirect(url_for('sell'))
+                # Update stock for every book in one statement
+                cases = ' '.join(['WHEN %s THEN %s'] * len(books_to_sell))
+                params = [value for book in books_to_sell for value in (book['book_id'], book['quantity'])]
+                cursor.execute(f"""
+                    UPDATE Available_Books
+                    SET Quantity = Quantity - CASE Bookid {cases} END
+                    WHERE Bookid IN ({placeholders})
+                """, tuple(params) + tuple(book['book_id'] for book in books_to_sell))
                 
-                books_to_sell.append({
-                    'book_id': book_id,
-                    'book_name': book['BookName'],
-                    'quantity': quantity,
-                    'price': book['Price']
-                })
-                total_amount += book['Price'] * quantity
-            
-            # Insert all sales records with same transaction_id
-            for book in books_to_sell:
-                cursor.execute("""
+                if cursor.rowcount != len(books_to_sell):
+                    raise SaleRejected('Stock changed while processing the sale. Please try again.')
+                
+                # Insert all sales records with same transaction_id in one batched statement
+                cursor.executemany("""
                     INSERT INTO Sales (transaction_id, CustomerName, PhoneNumber, Bookid, BookName, Quantity, Price)
                     VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """, (transaction_id, customer_name, phone_number, book['book_id'], 
-                      book['book_name'], book['quantity'], book['price']))
+                """, [(transaction_id, customer_name, phone_number, book['book_id'],
+                       book['book_name'], book['quantity'], book['price']) for book in books_to_sell])
                 
-                # Update stock
-                cursor.execute("""
-                    UPDATE Available_Books 
-                    SET Quantity = Quantity - %s 
-                    WHERE Bookid = %s
-                """, (book['quantity'], book['book_id']))
-            
-            conn.commit()
-            cursor.close()
-            conn.close()
+                conn.commit()
+            mark_write()
             
-            # Clear cache after sale
-            clear_book_cache()
+            # Clear caches after sale
+            invalidate_caches([book['book_id'] for book in books_to_sell])
             
             flash(f'Sale completed! Transaction ID: {transaction_id}. Total: ₹{total_amount}', 'success')
             return redirect(url_for('sell'))
-            
+        
+        # db_conn() rolls the transaction back for any exception raised inside it
+        except SaleRejected as e:
+            flash(str(e), 'error')
+            return redirect(url_for('sell'))
         except Exception as e:
             flash(f'Error processing sale: {str(e)}', 'error')
-            if conn:
-                conn.rollback()
-                conn.close()
             return redirect(url_for('sell'))
     
     # GET request - display form with available books
     books = []
-    if conn:
-        try:
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute("SELECT * FROM Available_Books WHERE Quantity > 0 ORDER BY Genre, BookName")
+    try:
+        with db_conn(dictionary=True, read_only=True) as (conn, cursor):
+            cursor.execute("""
+                SELECT Bookid, BookName, Quantity, Price FROM Available_Books
+                WHERE Quantity > 0 ORDER BY Genre, BookName
+            """)
             books = cursor.fetchall()
-            cursor.close()
-            conn.close()
-        except Error as e:
-            flash(f'Error fetching books: {str(e)}', 'error')
+    except Error as e:
+        flash(f'Error fetching books: {str(e)}', 'error')
     
     return render_template('sell.html', books=books)
 
 @app.route('/stock')
 @login_required
 def stock():
-    """View all books in stock"""
-    conn = get_db_connection()
+    """View books in stock, one page at a time"""
+    page = max(request.args.get('page', 1, type=int), 1)
     books = []
+    total_books = 0
     
-    if conn:
-        try:
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute("SELECT * FROM Available_Books ORDER BY Genre, BookName")
+    try:
+        with db_conn(dictionary=True, read_only=True) as (conn, cursor):
+            # Reuse the dashboard's book count for the pager when it is cached
+            cached_stats = get_cached_stats()
+            if cached_stats:
+                total_books = cached_stats['total_books']
+            else:
+                cursor.execute("SELECT COUNT(*) AS total FROM Available_Books")
+                total_books = cursor.fetchone()['total']
+            
+            cursor.execute("""
+                SELECT Bookid, BookName, Genre, Quantity, Author, Publication, Price
+                FROM Available_Books
+                ORDER BY Genre, BookName
+                LIMIT %s OFFSET %s
+            """, (PER_PAGE, (page - 1) * PER_PAGE))
             books = cursor.fetchall()
-            cursor.close()
-            conn.close()
-        except Error as e:
-            flash(f'Error fetching stock: {str(e)}', 'error')
+    except Error as e:
+        flash(f'Error fetching stock: {str(e)}', 'error')
     
-    return render_template('stock.html', books=books)
+    total_pages = max((total_books + PER_PAGE - 1) // PER_PAGE, 1)
+    return stream_page('stock.html', books=books, page=page,
+                       total_pages=total_pages, total_books=total_books)
 
 @app.route('/stock/add', methods=['GET', 'POST'])
 @login_required
@@ -627,26 +1492,23 @@ def add_book():
             flash('Invalid quantity or price.', 'error')
             return render_template('add_book.html')
         
-        conn = get_db_connection()
-        if not conn:
-            flash('Database connection error. Please try again.', 'error')
-            return render_template('add_book.html')
-        
         try:
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO Available_Books (Bookid, BookName, Genre, Quantity, Author, Publication, Price)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """, (book_id, book_name, genre, quantity, author, publication, price))
-            conn.commit()
-            cursor.close()
-            conn.close()
+            with db_conn() as (conn, cursor):
+                cursor.execute("""
+                    INSERT INTO Available_Books (Bookid, BookName, Genre, Quantity, Author, Publication, Price)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                """, (book_id, book_name, genre, quantity, author, publication, price))
+                conn.commit()
+            mark_write()
             
-            # Clear cache after adding new book
-            clear_book_cache()
+            # Clear caches after adding new book
+            invalidate_caches([book_id])
             
             flash(f'Book "{book_name}" added successfully!', 'success')
             return redirect(url_for('stock'))
+        except DatabaseUnavailable as e:
+            flash(e.msg, 'error')
+            return render_template('add_book.html')
         except Error as e:
             if 'Duplicate entry' in str(e):
                 flash(f'Book with ID {book_id} already exists.', 'error')
@@ -682,44 +1544,33 @@ def update_stock():
         flash('Invalid quantity.', 'error')
         return redirect(url_for('stock'))
     
-    conn = get_db_connection()
-    if not conn:
-        flash('Database connection error. Please try again.', 'error')
-        return redirect(url_for('stock'))
-    
     try:
-        cursor = conn.cursor(dictionary=True)
-        
-        # Get current quantity
-        cursor.execute("SELECT * FROM Available_Books WHERE Bookid = %s", (book_id,))
-        book = cursor.fetchone()
-        
-        if not book:
-            flash(f'Book with ID {book_id} not found.', 'error')
-            cursor.close()
-            conn.close()
-            return redirect(url_for('stock'))
-        
-        # Calculate new quantity
-        if action == 'add':
-            new_quantity = book['Quantity'] + quantity
-        else:  # subtract
-            new_quantity = book['Quantity'] - quantity
-            if new_quantity < 0:
-                flash('Cannot subtract more than available quantity.', 'error')
-                cursor.close()
-                conn.close()
+        with db_conn(dictionary=True) as (conn, cursor):
+            # Get current quantity
+            cursor.execute("SELECT BookName, Quantity FROM Available_Books WHERE Bookid = %s", (book_id,))
+            book = cursor.fetchone()
+            
+            if not book:
+                flash(f'Book with ID {book_id} not found.', 'error')
                 return redirect(url_for('stock'))
+            
+            # Calculate new quantity
+            if action == 'add':
+                new_quantity = book['Quantity'] + quantity
+            else:  # subtract
+                new_quantity = book['Quantity'] - quantity
+                if new_quantity < 0:
+                    flash('Cannot subtract more than available quantity.', 'error')
+                    return redirect(url_for('stock'))
+            
+            # Update quantity
+            cursor.execute("UPDATE Available_Books SET Quantity = %s WHERE Bookid = %s", 
+                         (new_quantity, book_id))
+            conn.commit()
+        mark_write()
         
-        # Update quantity
-        cursor.execute("UPDATE Available_Books SET Quantity = %s WHERE Bookid = %s", 
-                     (new_quantity, book_id))
-        conn.commit()
-        cursor.close()
-        conn.close()
-        
-        # Clear cache after stock update
-        clear_book_cache()
+        # Clear caches after stock update
+        invalidate_caches([book_id])
         
         action_text = 'added to' if action == 'add' else 'subtracted from'
         flash(f'{quantity} units {action_text} "{book["BookName"]}" successfully!', 'success')
@@ -727,56 +1578,114 @@ def update_stock():
         
     except Error as e:
         flash(f'Error updating stock: {str(e)}', 'error')
-        if conn:
-            conn.close()
         return redirect(url_for('stock'))
 
 @app.route('/sales')
 @login_required
 def sales():
-    """View all sales records grouped by transaction"""
-    conn = get_db_connection()
+    """View sales records grouped by transaction, one page at a time"""
+    # Keyset pagination: the page starts after the (SaleDate, transaction_id)
+    # of the last transaction on the previous page, avoiding OFFSET scans
+    before_date = request.args.get('before_date', '').strip()
+    before_txn = request.args.get('before_txn', '').strip()
+    
     transactions = {}
     total_sales = 0
+    total_transactions = 0
+    next_cursor = None
     
-    if conn:
-        try:
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute("""
-                SELECT transaction_id, CustomerName, PhoneNumber, BookName, 
-                       Quantity, Price, (Quantity * Price) as Subtotal, SaleDate
-                FROM Sales 
-                ORDER BY SaleDate DESC, transaction_id DESC
-            """)
-            sales_records = cursor.fetchall()
+    try:
+        with db_conn(dictionary=True, read_only=True) as (conn, cursor):
+            # The grand totals scan all of Sales, so they are cached like the dashboard stats
+            totals = get_cached_sales_totals()
+            if totals is None:
+                cursor.execute("""
+                    SELECT COALESCE(SUM(Price * Quantity), 0) AS total_sales,
+                           COUNT(DISTINCT transaction_id) AS total_transactions
+                    FROM Sales
+                """)
+                row = cursor.fetchone()
+                totals = (row['total_sales'], row['total_transactions'])
+                cache_sales_totals(totals)
+            total_sales, total_transactions = totals
             
-            # Group by transaction_id
-            for record in sales_records:
-                txn_id = record['transaction_id']
-                if txn_id not in transactions:
-                    transactions[txn_id] = {
-                        'customer_name': record['CustomerName'],
-                        'phone_number': record['PhoneNumber'],
-                        'sale_date': record['SaleDate'],
-                        'books': [],
-                        'total': 0
-                    }
-                
-                transactions[txn_id]['books'].append({
-                    'book_name': record['BookName'],
-                    'quantity': record['Quantity'],
-                    'price': record['Price'],
-                    'subtotal': record['Subtotal']
-                })
-                transactions[txn_id]['total'] += record['Subtotal']
-                total_sales += record['Subtotal']
+            # One header row per transaction, summed by MySQL. Rows of a
+            # transaction share SaleDate, so grouping by (SaleDate, transaction_id)
+            # lets idx_sales_date produce the groups in order and MySQL stops
+            # after PER_PAGE of them instead of aggregating the whole table
+            if before_date and before_txn:
+                cursor.execute("""
+                    SELECT SaleDate, transaction_id, MAX(CustomerName) AS CustomerName,
+                           MAX(PhoneNumber) AS PhoneNumber, SUM(Quantity * Price) AS total
+                    FROM Sales
+                    WHERE SaleDate < %s OR (SaleDate = %s AND transaction_id < %s)
+                    GROUP BY SaleDate, transaction_id
+                    ORDER BY SaleDate DESC, transaction_id DESC
+                    LIMIT %s
+                """, (before_date, before_date, before_txn, PER_PAGE))
+            else:
+                cursor.execute("""
+                    SELECT SaleDate, transaction_id, MAX(CustomerName) AS CustomerName,
+                           MAX(PhoneNumber) AS PhoneNumber, SUM(Quantity * Price) AS total
+                    FROM Sales
+                    GROUP BY SaleDate, transaction_id
+                    ORDER BY SaleDate DESC, transaction_id DESC
+                    LIMIT %s
+                """, (PER_PAGE,))
+            headers = cursor.fetchall()
             
-            cursor.close()
-            conn.close()
-        except Error as e:
-            flash(f'Error fetching sales: {str(e)}', 'error')
+            for header in headers:
+                # A legacy transaction whose rows weren't normalized yet comes back as
+                # several groups; add them up rather than keep only the last one
+                if header['transaction_id'] in transactions:
+                    transactions[header['transaction_id']]['total'] += header['total']
+                    continue
+                transactions[header['transaction_id']] = {
+                    'customer_name': header['CustomerName'],
+                    'phone_number': header['PhoneNumber'],
+                    'sale_date': header['SaleDate'],
+                    'books': [],
+                    'total': header['total']
+                }
+            
+            # Line items only for the transactions on this page
+            if transactions:
+                placeholders = ', '.join(['%s'] * len(transactions))
+                cursor.execute(f"""
+                    SELECT transaction_id, BookName, Quantity, Price,
+                           (Quantity * Price) AS Subtotal
+                    FROM Sales
+                    WHERE transaction_id IN ({placeholders})
+                    ORDER BY id
+                """, tuple(transactions))
+                for item in cursor.fetchall():
+                    transactions[item['transaction_id']]['books'].append({
+                        'book_name': item['BookName'],
+                        'quantity': item['Quantity'],
+                        'price': item['Price'],
+                        'subtotal': item['Subtotal']
+                    })
+        
+        if len(headers) == PER_PAGE:
+            last = headers[-1]
+            next_cursor = {
+                'before_date': last['SaleDate'].strftime('%Y-%m-%d %H:%M:%S'),
+                'before_txn': last['transaction_id']
+            }
+    except Error as e:
+        flash(f'Error fetching sales: {str(e)}', 'error')
     
-    return render_template('sales.html', transactions=transactions, total_sales=total_sales)
+    return stream_page('sales.html', transactions=transactions, total_sales=total_sales,
+                       total_transactions=total_transactions, next_cursor=next_cursor,
+                       is_first_page=not (before_date and before_txn))
+
+def revalidated_response(response, data):
+    """Tag a book API response with an ETag of its data and answer If-None-Match with 304"""
+    encoded = data if isinstance(data, bytes) else repr(data).encode()
+    response.set_etag(hashlib.blake2b(encoded, digest_size=8).hexdigest())
+    # Stock changes with every sale, so browsers keep the body but must revalidate it
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
 
 @app.route('/api/book/<book_id>')
 @login_required
@@ -784,47 +1693,46 @@ def get_book_details(book_id):
     """API endpoint to fetch book details for AJAX requests - OPTIMIZED"""
     
     # Check cache first
+    # Books are cached as (BookName, Price, Quantity) tuples
     cached_book = get_cached_book(book_id)
     if cached_book:
-        return jsonify({
+        book_name, price, quantity = cached_book
+        return revalidated_response(jsonify({
             'success': True,
-            'book_name': cached_book['BookName'],
-            'price': cached_book['Price'],
-            'available_quantity': cached_book['Quantity'],
-            'cached': True  # For debugging
-        })
+            'book_name': book_name,
+            'price': price,
+            'available_quantity': quantity
+        }), cached_book)
     
     # Not in cache, fetch from database
-    conn = get_db_connection()
-    if not conn:
-        app.logger.error(f"Database connection failed for book {book_id}")
-        return jsonify({
-            'success': False, 
-            'message': 'Database connection error. Please try again.',
-            'error_type': 'connection'
-        }), 503
-    
     try:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(
-            "SELECT BookName, Price, Quantity FROM Available_Books WHERE Bookid = %s", 
-            (book_id,)
-        )
-        book = cursor.fetchone()
-        cursor.close()
-        conn.close()
+        with book_load_lock(book_id):
+            # Another request may have loaded it while we waited for the lock
+            book = get_cached_book(book_id)
+            if book is None:
+                # A write committing during the query bumps the version; the row
+                # read before it must not outlive that write's invalidation
+                version = get_catalog_version()
+                with db_conn(read_only=True) as (conn, cursor):
+                    cursor.execute(
+                        "SELECT BookName, Price, Quantity FROM Available_Books WHERE Bookid = %s", 
+                        (book_id,)
+                    )
+                    book = cursor.fetchone()
+                    cacheable = not is_replica_connection(conn) and get_catalog_version() == version
+                
+                if book and cacheable:
+                    # Cache the result
+                    cache_book(book_id, book)
         
         if book:
-            # Cache the result
-            cache_book(book_id, book)
-            
-            return jsonify({
+            book_name, price, quantity = book
+            return revalidated_response(jsonify({
                 'success': True,
-                'book_name': book['BookName'],
-                'price': book['Price'],
-                'available_quantity': book['Quantity'],
-                'cached': False
-            })
+                'book_name': book_name,
+                'price': price,
+                'available_quantity': quantity
+            }), book)
         else:
             return jsonify({
                 'success': False, 
@@ -832,38 +1740,192 @@ def get_book_details(book_id):
                 'error_type': 'not_found'
             }), 404
             
+    except DatabaseUnavailable as e:
+        app.logger.error("Database connection failed for book %s", book_id)
+        return jsonify({
+            'success': False, 
+            'message': e.msg,
+            'error_type': 'connection'
+        }), 503
     except Exception as e:
-        app.logger.error(f"Error fetching book {book_id}: {e}")
+        app.logger.error("Error fetching book %s: %s", book_id, e)
         return jsonify({
             'success': False, 
             'message': f'Error fetching book details: {str(e)}',
             'error_type': 'query_error'
         }), 500
 
+# Most IDs accepted by one /api/books request
+MAX_BATCH_BOOK_IDS = 100
+
+@app.route('/api/books')
+@login_required
+def get_books_batch():
+    """Fetch details for several books (?ids=B001,B002) in one request"""
+    book_ids = list(dict.fromkeys(i.strip() for i in request.args.get('ids', '').split(',') if i.strip()))
+    if not book_ids:
+        return jsonify({'success': False, 'message': 'No book IDs given.'}), 400
+    if len(book_ids) > MAX_BATCH_BOOK_IDS:
+        return jsonify({
+            'success': False,
+            'message': f'At most {MAX_BATCH_BOOK_IDS} book IDs per request.'
+        }), 400
+    
+    books = get_cached_books(book_ids)
+    misses = [book_id for book_id in book_ids if book_id not in books]
+    
+    try:
+        if misses:
+            placeholders = ', '.join(['%s'] * len(misses))
+            version = get_catalog_version()
+            with db_conn(read_only=True) as (conn, cursor):
+                cursor.execute(f"""
+                    SELECT Bookid, BookName, Price, Quantity FROM Available_Books
+                    WHERE Bookid IN ({placeholders})
+                """, tuple(misses))
+                rows = cursor.fetchall()
+                cacheable = not is_replica_connection(conn) and get_catalog_version() == version
+            
+            # Bookid matches case-insensitively, so map rows back to the IDs as requested
+            found = {row[0].lower(): row[1:] for row in rows}
+            fetched = {book_id: found[book_id.lower()] for book_id in misses if book_id.lower() in found}
+            if cacheable:
+                cache_books_bulk(fetched.items())
+            books.update(fetched)
+    except DatabaseUnavailable as e:
+        return jsonify({'success': False, 'message': e.msg, 'error_type': 'connection'}), 503
+    except Exception as e:
+        app.logger.error("Error fetching books %s: %s", misses, e)
+        return jsonify({
+            'success': False,
+            'message': f'Error fetching book details: {str(e)}',
+            'error_type': 'query_error'
+        }), 500
+    
+    # Unknown IDs map to null
+    result = {}
+    for book_id in book_ids:
+        book = books.get(book_id)
+        if book:
+            book_name, price, quantity = book
+            book = {'book_name': book_name, 'price': price, 'available_quantity': quantity}
+        result[book_id] = book
+    return jsonify({'success': True, 'books': result})
+
+# Column order of each book array in the /api/books/all response
+BOOK_COLUMNS = ('Bookid', 'BookName', 'Price', 'Quantity')
+
+def build_catalog(cursor, version, cache_books=True):
+    """Query the in-stock books and return the gzipped /api/books/all body for this catalog version"""
+    # Rows stay tuples and go out as arrays: no per-row dict, and the
+    # column names aren't repeated for every book
+    cursor.execute(f"SELECT {', '.join(BOOK_COLUMNS)} FROM Available_Books WHERE Quantity > 0")
+    books = cursor.fetchall()
+    
+    # Cache all books, unless the rows came from a replica (cache_books=False), a
+    # write bumped the version during the query (these rows may predate it and
+    # would outlive its invalidation) or, without Redis, the catalog is bigger
+    # than the cache and would just evict the hot books
+    if (cache_books and get_catalog_version() == version
+            and (_redis is not None or len(books) <= BOOK_CACHE_MAXSIZE)):
+        cache_books_bulk((book[0], book[1:]) for book in books)
+    
+    body = app.json.dumps({
+        'success': True,
+        'count': len(books),
+        'columns': BOOK_COLUMNS,
+        'books': books
+    }).encode()
+    # Compressed once per catalog version rather than per response;
+    # mtime=0 keeps the bytes (and so the ETag) stable
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+class CatalogRefresher:
+    """Rebuild the cached catalog in the background so /api/books/all rarely touches MySQL.
+    
+    The body is rebuilt right after a write (invalidate_caches() wakes the
+    thread) and otherwise every interval seconds, which also picks up stock
+    changed by other workers when there is no shared Redis.
+    """
+    
+    def __init__(self, interval=CACHE_TTL_S):
+        self.interval = interval
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._worker = None
+    
+    def start(self):
+        """Start the refresh thread if it isn't running yet"""
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='catalog-refresher', daemon=True)
+                self._worker.start()
+    
+    def trigger(self):
+        """Ask for an early rebuild (a no-op until start() has been called)"""
+        self._wake.set()
+    
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.refresh()
+            except Exception as e:
+                app.logger.warning("Catalog refresh failed: %s", e)
+    
+    def refresh(self):
+        """Build the catalog for the current version and cache it"""
+        version = get_catalog_version()
+        if version is None:
+            return
+        # The primary, not a replica: right after a write a lagging replica
+        # would store the old stock under the new version
+        conn = get_db_connection(kind='write')
+        if conn is None:
+            return
+        try:
+            cursor = conn.cursor()
+            try:
+                body = build_catalog(cursor, version)
+            finally:
+                cursor.close()
+        finally:
+            release_connection(conn)
+        cache_catalog(version, body, replace=True)
+
+catalog_refresher = CatalogRefresher()
+
 @app.route('/api/books/all')
 @login_required
 def get_all_books():
     """Fetch all books at once for prefetching/caching"""
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({'success': False, 'message': 'Database connection error'}), 503
-    
     try:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT Bookid, BookName, Price, Quantity FROM Available_Books WHERE Quantity > 0")
-        books = cursor.fetchall()
-        cursor.close()
-        conn.close()
+        # Read the version first: a write during the query bumps it, so the
+        # body built here is never served as the newer version
+        version = get_catalog_version()
+        compressed = get_cached_catalog(version) if version is not None else None
         
-        # Cache all books
-        for book in books:
-            cache_book(book['Bookid'], book)
+        if compressed is None:
+            # Normally catalog_refresher has this ready; build it here on a miss
+            with db_conn(read_only=True) as (conn, cursor):
+                from_replica = is_replica_connection(conn)
+                compressed = build_catalog(cursor, version, cache_books=not from_replica)
+            # Release the connection before the body is sent rather than after
+            close_db(None)
+            if version is not None and not from_replica:
+                cache_catalog(version, compressed)
         
-        return jsonify({
-            'success': True,
-            'books': books,
-            'count': len(books)
-        })
+        # q=0 means the client refuses gzip even though it names it
+        if request.accept_encodings['gzip'] > 0:
+            response = Response(compressed, mimetype='application/json')
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = Response(gzip.decompress(compressed), mimetype='application/json')
+        response.vary.add('Accept-Encoding')
+        return revalidated_response(response, response.get_data())
+    except DatabaseUnavailable:
+        return jsonify({'success': False, 'message': 'Database connection error'}), 503
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
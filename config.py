@@ -14,9 +14,30 @@ class Config:
     DB_PASSWORD = os.getenv('DB_PASSWORD', '')
     DB_NAME = os.getenv('DB_NAME', 'store')
     
+    # Optional read replica for read-only pages (same format as DATABASE_URL)
+    REPLICA_URL = os.getenv('REPLICA_URL')
+    
+    # Extra unpooled connections allowed while a connection pool is exhausted
+    DB_POOL_MAX_OVERFLOW = max(int(os.getenv('DB_POOL_MAX_OVERFLOW', '5')), 0)
+    
+    # Number of server processes, each with its own pools (gunicorn.conf.py sets it)
+    WEB_CONCURRENCY = max(int(os.getenv('WEB_CONCURRENCY', '1')), 1)
+    
+    # Optional Redis server to share the book cache between workers (e.g. redis://localhost:6379/0)
+    REDIS_URL = os.getenv('REDIS_URL')
+    
+    # Seconds to wait when opening a MySQL connection before giving up
+    DB_CONNECT_TIMEOUT = int(os.getenv('DB_CONNECT_TIMEOUT', '2'))
+    
+    # Compress the MySQL wire protocol (useful when the database is remote)
+    DB_COMPRESS = os.getenv('DB_COMPRESS', 'false').lower() == 'true'
+    
     # Handle DATABASE_URL from Heroku/Railway (if provided)
     DATABASE_URL = os.getenv('DATABASE_URL')
     
+    # Coalesce concurrent login/user lookups into batched queries (for high login traffic)
+    ENABLE_LOGIN_BATCHING = os.getenv('ENABLE_LOGIN_BATCHING', 'false').lower() == 'true'
+    
     # Session settings
     SESSION_COOKIE_SECURE = os.getenv('FLASK_ENV') == 'production'
     SESSION_COOKIE_HTTPONLY = True
@@ -35,3 +56,4 @@ class ProductionConfig(Config):
     """Production configuration"""
     DEBUG = False
     SESSION_COOKIE_SECURE = True
+    TEMPLATES_AUTO_RELOAD = False
@@ -0,0 +1,66 @@
+"""
+Gunicorn settings for production (picked up automatically by `gunicorn app:app`)
+"""
+import logging
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# Threads overlap the MySQL waits within a worker
+worker_class = 'gthread'
+threads = max(int(os.getenv('GUNICORN_THREADS', '8')), 1)
+
+# A worker never runs more than `threads` requests at once, so bigger pools would
+# only hold idle connections open. mysql-connector opens every pooled connection
+# up front, so cap both pools here (app.py reads these when it creates them)
+log = logging.getLogger('gunicorn.error')
+
+def pool_size(names, default):
+    """Pool size from the first of these variables that is set, validated like app.get_pool_size()"""
+    for name in names:
+        value = os.getenv(name)
+        if value:
+            try:
+                size = int(value)
+            except ValueError:
+                size = 0
+            # mysql-connector refuses pools larger than 32
+            if 1 <= size <= 32:
+                return size
+            log.warning("Invalid %s %s, using default %s", name, value, default)
+            return default
+    return default
+
+for env_var, names, default in (('DB_READ_POOL_SIZE', ('DB_READ_POOL_SIZE', 'DB_POOL_SIZE'), 25),
+                                ('DB_WRITE_POOL_SIZE', ('DB_WRITE_POOL_SIZE',), 6)):
+    size = pool_size(names, default)
+    capped = min(size, threads)
+    # Only a size someone chose is worth a warning; the defaults are capped silently
+    if capped < size and any(os.getenv(name) for name in names):
+        log.warning("%s %s capped at %s, the number of threads per worker", env_var, size, capped)
+    os.environ[env_var] = str(capped)
+
+# WEB_CONCURRENCY (set by Heroku and most PaaS) overrides the default, which is
+# 2 * CPUs + 1 but no more workers than fit in 75% of MySQL's max_connections
+# (DB_MAX_CONNECTIONS, 151 by default like the server setting)
+connections_per_worker = (int(os.environ['DB_READ_POOL_SIZE']) + int(os.environ['DB_WRITE_POOL_SIZE'])
+                          + int(os.getenv('DB_POOL_MAX_OVERFLOW', '5')))
+connection_budget = int(int(os.getenv('DB_MAX_CONNECTIONS', '151')) * 0.75)
+workers = int(os.getenv('WEB_CONCURRENCY',
+                        min(multiprocessing.cpu_count() * 2 + 1,
+                            max(connection_budget // connections_per_worker, 1))))
+# Lets app.py check the pools of every worker against max_connections
+os.environ['WEB_CONCURRENCY'] = str(workers)
+
+# Import the app once in the master so workers share its memory copy-on-write.
+# Nothing connects to MySQL at import (pools are created on first use), and
+# init_db() must stay out of import time: run `flask --app app init-db` instead
+preload_app = True
+
+def post_fork(server, worker):
+    """Start the worker's own background threads; threads don't survive fork()"""
+    import app
+    if not app.app.debug:
+        app.start_log_listener(app.file_handler)
+    app.catalog_refresher.start()
@@ -4,7 +4,7 @@ Migration script to add transaction_id to existing Sales table
 Run this once if database already exists
 """
 
-from app import app, get_db_connection
+from app import app, get_db_connection, normalize_sale_dates
 from mysql.connector import Error
 
 def migrate_sales_table():
@@ -22,7 +22,12 @@ def migrate_sales_table():
         result = cursor.fetchone()
         
         if result:
-            print("transaction_id column already exists. No migration needed.")
+            print("transaction_id column already exists.")
+            updated = normalize_sale_dates(cursor)
+            conn.commit()
+            print(f"✓ Aligned SaleDate of {updated} rows with their transactions")
+            cursor.close()
+            conn.close()
             return True
         
         print("Adding transaction_id column...")
@@ -33,23 +38,25 @@ def migrate_sales_table():
             ADD COLUMN transaction_id VARCHAR(50) NOT NULL DEFAULT '' AFTER id
         """)
         
-        # Add index
-        cursor.execute("""
-            ALTER TABLE Sales 
-            ADD INDEX idx_transaction (transaction_id)
-        """)
-        
         # Generate transaction IDs for existing records
         cursor.execute("""
             UPDATE Sales 
             SET transaction_id = CONCAT('TXN-LEGACY-', LPAD(id, 6, '0'))
             WHERE transaction_id = '' OR transaction_id IS NULL
         """)
+        updated = cursor.rowcount
+        
+        # Add index once the IDs are filled in, so it is built in one pass
+        # rather than maintained during the UPDATE (same index as init_db())
+        cursor.execute("""
+            ALTER TABLE Sales 
+            ADD INDEX idx_sales_totals (transaction_id, Quantity, Price), ALGORITHM=INPLACE, LOCK=NONE
+        """)
         
         conn.commit()
         print("✓ Migration completed successfully!")
         print(f"✓ Added transaction_id column")
-        print(f"✓ Updated {cursor.rowcount} existing records")
+        print(f"✓ Updated {updated} existing records")
         
         cursor.close()
         conn.close()
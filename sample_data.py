@@ -8,6 +8,9 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# Rows sent per INSERT statement
+BATCH_SIZE = 1000
+
 def add_sample_books():
     """Add sample books to the database for testing"""
     try:
@@ -31,26 +34,23 @@ def add_sample_books():
             ('B008', '1984', 'Fiction', 22, 'George Orwell', 'Secker & Warburg', 299),
         ]
         
+        # Insert in batches of multi-row INSERTs; IGNORE skips books that already exist
         added_count = 0
-        for book in sample_books:
-            try:
-                cursor.execute("""
-                    INSERT INTO Available_Books 
-                    (Bookid, BookName, Genre, Quantity, Author, Publication, Price)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """, book)
-                added_count += 1
-                print(f"Added: {book[1]}")
-            except mysql.connector.Error as e:
-                if 'Duplicate entry' in str(e):
-                    print(f"Skipped (already exists): {book[1]}")
-                else:
-                    print(f"Error adding {book[1]}: {e}")
+        for start in range(0, len(sample_books), BATCH_SIZE):
+            batch = sample_books[start:start + BATCH_SIZE]
+            cursor.executemany("""
+                INSERT IGNORE INTO Available_Books 
+                (Bookid, BookName, Genre, Quantity, Author, Publication, Price)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """, batch)
+            added_count += cursor.rowcount
+            print(f"Processed {start + len(batch)} of {len(sample_books)} books...")
         
         conn.commit()
         cursor.close()
         conn.close()
-        print(f"\nSample data script completed! Added {added_count} new books.")
+        print(f"\nSample data script completed! Added {added_count} new books "
+              f"({len(sample_books) - added_count} already existed).")
         
     except mysql.connector.Error as e:
         print(f"Database error: {e}")
@@ -16,6 +16,13 @@ class MultipleBooksSellTests(unittest.TestCase):
         self.app = app.test_client()
         self.app.testing = True
     
+    def log_in(self, username='seller'):
+        """Log the test client in as username without a database lookup"""
+        from app import cache_user
+        cache_user(username, True)
+        with self.app.session_transaction() as sess:
+            sess['_user_id'] = username
+    
     def test_api_book_endpoint_exists(self):
         """Test that the API book endpoint is registered"""
         with app.test_request_context():
@@ -58,6 +65,109 @@ class MultipleBooksSellTests(unittest.TestCase):
         response = self.app.get('/api/book/TEST123', follow_redirects=False)
         # Should redirect to login since we're not authenticated
         self.assertEqual(response.status_code, 302)
+    
+    def test_sell_uses_one_query_per_step(self):
+        """Test that a multi-book sale locks, updates and inserts with one statement each"""
+        self.log_in()
+        
+        conn = MagicMock()
+        cursor = conn.cursor.return_value
+        cursor.fetchall.return_value = [
+            ('B001', 'Book A', 5, 100),
+            ('B002', 'Book B', 5, 150),
+        ]
+        cursor.rowcount = 2
+        
+        with patch('app.get_db_connection', return_value=conn):
+            response = self.app.post('/sell', data={
+                'customer_name': 'John',
+                'phone_number': '1234567890',
+                'book_id[]': ['B001', 'B002'],
+                'quantity[]': ['2', '1'],
+            })
+        
+        self.assertEqual(response.status_code, 302)
+        conn.start_transaction.assert_called_once_with(isolation_level='READ COMMITTED')
+        self.assertEqual(cursor.execute.call_count, 2)  # SELECT ... FOR UPDATE, UPDATE
+        self.assertIn('FOR UPDATE', cursor.execute.call_args_list[0].args[0])
+        self.assertEqual(len(cursor.executemany.call_args.args[1]), 2)
+        conn.commit.assert_called_once()
+    
+    def test_sales_page_groups_in_sql(self):
+        """Test that /sales sums per transaction in SQL and fetches items for that page only"""
+        from app import clear_stats_cache
+        clear_stats_cache()
+        self.log_in()
+        
+        conn = MagicMock()
+        cursor = conn.cursor.return_value
+        cursor.fetchone.return_value = {'total_sales': 950, 'total_transactions': 2}
+        cursor.fetchall.side_effect = [
+            [{'transaction_id': 'TXN-002', 'CustomerName': 'Jane', 'PhoneNumber': '0987654321',
+              'SaleDate': datetime(2026, 1, 2), 'total': 600},
+             {'transaction_id': 'TXN-001', 'CustomerName': 'John', 'PhoneNumber': '1234567890',
+              'SaleDate': datetime(2026, 1, 1), 'total': 350}],
+            [{'transaction_id': 'TXN-001', 'BookName': 'Book A', 'Quantity': 2, 'Price': 100, 'Subtotal': 200},
+             {'transaction_id': 'TXN-001', 'BookName': 'Book B', 'Quantity': 1, 'Price': 150, 'Subtotal': 150},
+             {'transaction_id': 'TXN-002', 'BookName': 'Book C', 'Quantity': 3, 'Price': 200, 'Subtotal': 600}],
+        ]
+        
+        with patch('app.get_db_connection', return_value=conn):
+            response = self.app.get('/sales')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Book C', response.data)
+        header_sql = cursor.execute.call_args_list[1].args[0]
+        self.assertIn('GROUP BY SaleDate, transaction_id', header_sql)
+        items_call = cursor.execute.call_args_list[2]
+        self.assertIn('WHERE transaction_id IN', items_call.args[0])
+        self.assertEqual(items_call.args[1], ('TXN-002', 'TXN-001'))
+        
+        # The grand totals come from the cache on the next page view
+        cursor.reset_mock()
+        cursor.fetchall.side_effect = [[]]
+        with patch('app.get_db_connection', return_value=conn):
+            self.app.get('/sales')
+        self.assertEqual(cursor.execute.call_count, 1)
+    
+    def test_sales_page_adds_up_split_transaction(self):
+        """Test that a legacy transaction whose rows straddle a second is shown once with its full total"""
+        from app import clear_stats_cache
+        clear_stats_cache()
+        self.log_in()
+        
+        conn = MagicMock()
+        cursor = conn.cursor.return_value
+        cursor.fetchone.return_value = {'total_sales': 600, 'total_transactions': 1}
+        cursor.fetchall.side_effect = [
+            [{'transaction_id': 'TXN-001', 'CustomerName': 'John', 'PhoneNumber': '1234567890',
+              'SaleDate': datetime(2026, 1, 1, 12, 0, 1), 'total': 400},
+             {'transaction_id': 'TXN-001', 'CustomerName': 'John', 'PhoneNumber': '1234567890',
+              'SaleDate': datetime(2026, 1, 1, 12, 0, 0), 'total': 200}],
+            [{'transaction_id': 'TXN-001', 'BookName': 'Book A', 'Quantity': 2, 'Price': 100, 'Subtotal': 200},
+             {'transaction_id': 'TXN-001', 'BookName': 'Book B', 'Quantity': 2, 'Price': 200, 'Subtotal': 400}],
+        ]
+        
+        with patch('app.get_db_connection', return_value=conn), \
+             patch('app.stream_template', return_value=iter([''])) as stream:
+            self.app.get('/sales').get_data()
+        
+        transactions = stream.call_args.kwargs['transactions']
+        self.assertEqual(list(transactions), ['TXN-001'])
+        self.assertEqual(transactions['TXN-001']['total'], 600)
+        self.assertEqual(len(transactions['TXN-001']['books']), 2)
+        self.assertEqual(cursor.execute.call_args_list[2].args[1], ('TXN-001',))
+    
+    def test_normalize_sale_dates_aligns_transactions(self):
+        """Test that the migration step sets each transaction's rows to its first SaleDate"""
+        from app import normalize_sale_dates
+        cursor = MagicMock()
+        cursor.rowcount = 1
+        
+        self.assertEqual(normalize_sale_dates(cursor), 1)
+        sql = cursor.execute.call_args.args[0]
+        self.assertIn('MIN(SaleDate)', sql)
+        self.assertIn('SET s.SaleDate = t.first_date', sql)
 
 class TransactionLogicTests(unittest.TestCase):
     """Test the transaction logic without database"""
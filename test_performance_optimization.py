@@ -15,6 +15,13 @@ from app import (
     CACHE_DURATION
 )
 
+def log_in(client, username='reader'):
+    """Log the test client in as username without a database lookup"""
+    from app import cache_user
+    cache_user(username, True)
+    with client.session_transaction() as sess:
+        sess['_user_id'] = username
+
 class CachingTests(unittest.TestCase):
     """Test cases for the book caching functionality"""
     
@@ -79,11 +86,11 @@ class CachingTests(unittest.TestCase):
             'Quantity': 7
         }
         
-        # Mock the cache with an old timestamp
+        # Mock the cache with an entry whose deadline has passed
         from app import _book_cache, _cache_lock_book
         with _cache_lock_book:
-            old_timestamp = datetime.now() - timedelta(minutes=10)  # 10 minutes ago
-            _book_cache[book_id] = (book_data, old_timestamp)
+            old_deadline = time.monotonic() - timedelta(minutes=5).total_seconds()  # expired 5 minutes ago
+            _book_cache[book_id] = (book_data, old_deadline)
         
         # Try to retrieve - should be None due to expiry
         cached = get_cached_book(book_id)
@@ -106,6 +113,222 @@ class CachingTests(unittest.TestCase):
             cached = get_cached_book(book_id)
             self.assertIsNotNone(cached)
             self.assertEqual(cached['BookName'], books[book_id]['BookName'])
+    
+    def test_least_recently_used_evicted(self):
+        """Test that the cache evicts the least recently used book when full"""
+        with patch('app.BOOK_CACHE_MAXSIZE', 2):
+            cache_book('LRU1', {'BookName': 'One', 'Price': 1, 'Quantity': 1})
+            cache_book('LRU2', {'BookName': 'Two', 'Price': 2, 'Quantity': 2})
+            get_cached_book('LRU1')  # LRU2 is now the least recently used
+            cache_book('LRU3', {'BookName': 'Three', 'Price': 3, 'Quantity': 3})
+        
+        self.assertIsNotNone(get_cached_book('LRU1'))
+        self.assertIsNone(get_cached_book('LRU2'))
+        self.assertIsNotNone(get_cached_book('LRU3'))
+    
+    def test_cache_hit_does_not_wait_for_lock(self):
+        """Test that a cache hit is served while another thread holds the cache lock"""
+        from app import _cache_lock_book
+        cache_book('HOT001', ('Hot Book', 100, 5))
+        
+        with _cache_lock_book:
+            self.assertEqual(get_cached_book('HOT001'), ('Hot Book', 100, 5))
+    
+    def test_cache_books_bulk(self):
+        """Test that a bulk insert caches every book and respects the size limit"""
+        from app import cache_books_bulk
+        with patch('app.BOOK_CACHE_MAXSIZE', 2):
+            cache_books_bulk([('BULK1', ('One', 1, 1)), ('BULK2', ('Two', 2, 2)), ('BULK3', ('Three', 3, 3))])
+        
+        self.assertIsNone(get_cached_book('BULK1'))
+        self.assertEqual(get_cached_book('BULK2'), ('Two', 2, 2))
+        self.assertEqual(get_cached_book('BULK3'), ('Three', 3, 3))
+    
+    def test_redis_book_cache(self):
+        """Test that books are shared through Redis when REDIS_URL is configured"""
+        client = MagicMock()
+        client.get.return_value = b'["Shared Book", 100, 4]'
+        
+        with patch('app._redis', client):
+            cache_book('R001', ('Shared Book', 100, 4))
+            cached = get_cached_book('R001')
+        
+        key = client.set.call_args.args[0]
+        self.assertEqual(key, 'bookstore:book:r001')
+        self.assertEqual(client.set.call_args.kwargs, {'ex': 300})
+        self.assertEqual(cached, ('Shared Book', 100, 4))
+    
+    def test_redis_invalidation_deletes_changed_books_only(self):
+        """Test that a write deletes just its books' Redis keys instead of scanning for all of them"""
+        from app import invalidate_caches
+        client = MagicMock()
+        client.get.return_value = b'0'
+        
+        with patch('app._redis', client):
+            invalidate_caches(['B001', 'b002'])
+        
+        client.delete.assert_called_once_with('bookstore:book:b001', 'bookstore:book:b002')
+        client.scan_iter.assert_not_called()
+    
+    def test_concurrent_misses_query_once(self):
+        """Test that concurrent requests for the same uncached book share one query"""
+        import threading
+        from app import cache_user
+        cache_user('reader', True)
+        
+        conn = MagicMock()
+        cursor = conn.cursor.return_value
+        
+        def slow_fetch():
+            time.sleep(0.05)
+            return ('Slow Book', 10, 1)
+        cursor.fetchone.side_effect = slow_fetch
+        
+        def worker():
+            client = app.test_client()
+            with client.session_transaction() as sess:
+                sess['_user_id'] = 'reader'
+            client.get('/api/book/SLOW1')
+        
+        with patch('app.get_db_connection', return_value=conn):
+            threads = [threading.Thread(target=worker) for _ in range(4)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        
+        self.assertEqual(cursor.execute.call_count, 1)
+
+class UserCacheTests(unittest.TestCase):
+    """Test cases for the load_user lookup cache"""
+    
+    def setUp(self):
+        """Clear cached users"""
+        from app import _user_cache, _cache_lock_user
+        with _cache_lock_user:
+            _user_cache.clear()
+    
+    def test_cache_user_and_retrieve(self):
+        """Test caching positive and negative user lookups"""
+        from app import cache_user, get_cached_user
+        cache_user('alice', True)
+        cache_user('ghost', False)
+        
+        self.assertTrue(get_cached_user('alice'))
+        self.assertFalse(get_cached_user('ghost'))
+        self.assertIsNone(get_cached_user('bob'))
+    
+    def test_invalidate_cached_user(self):
+        """Test that signup can drop a cached negative lookup"""
+        from app import cache_user, get_cached_user, invalidate_cached_user
+        cache_user('newuser', False)
+        invalidate_cached_user('newuser')
+        self.assertIsNone(get_cached_user('newuser'))
+    
+    def test_load_user_uses_cache(self):
+        """Test that load_user skips the database on a cache hit"""
+        from app import cache_user, load_user
+        cache_user('cached_user', True)
+        with patch('app.get_db_connection') as mock_conn:
+            user = load_user('cached_user')
+            mock_conn.assert_not_called()
+        self.assertEqual(user.id, 'cached_user')
+
+class StatsCacheTests(unittest.TestCase):
+    """Test cases for the dashboard stats cache"""
+    
+    def setUp(self):
+        """Clear cached stats"""
+        from app import clear_stats_cache
+        clear_stats_cache()
+    
+    def test_cache_stats_and_retrieve(self):
+        """Test caching dashboard stats"""
+        from app import cache_stats, get_cached_stats
+        stats = {'total_books': 5, 'total_sales': 1200, 'low_stock': 1}
+        cache_stats(stats)
+        self.assertEqual(get_cached_stats(), stats)
+    
+    def test_clear_stats_cache(self):
+        """Test that clearing drops cached stats"""
+        from app import cache_stats, get_cached_stats, clear_stats_cache
+        cache_stats({'total_books': 5, 'total_sales': 1200, 'low_stock': 1})
+        clear_stats_cache()
+        self.assertIsNone(get_cached_stats())
+    
+    def test_invalidate_caches_clears_books_and_stats(self):
+        """Test that a write invalidates both the stats and book caches"""
+        from app import cache_stats, get_cached_stats, invalidate_caches
+        cache_stats({'total_books': 5, 'total_sales': 1200, 'low_stock': 1})
+        cache_book('INV001', {'BookName': 'Book', 'Price': 100, 'Quantity': 5})
+        invalidate_caches()
+        self.assertIsNone(get_cached_stats())
+        self.assertIsNone(get_cached_book('INV001'))
+    
+    def test_stats_cache_expiry(self):
+        """Test that stats expire after STATS_CACHE_DURATION"""
+        from app import _stats_cache, _cache_lock_stats, get_cached_stats, STATS_CACHE_DURATION
+        with _cache_lock_stats:
+            _stats_cache['data'] = {'total_books': 1, 'total_sales': 0, 'low_stock': 0}
+            _stats_cache['timestamp'] = datetime.now() - STATS_CACHE_DURATION * 2
+        self.assertIsNone(get_cached_stats())
+
+class BatchingUserLookupTests(unittest.TestCase):
+    """Test cases for coalescing concurrent user lookups"""
+    
+    def test_concurrent_lookups_share_one_query(self):
+        """Test that concurrent lookups are answered by a single IN query"""
+        import threading
+        from app import BatchingUserLookup
+        
+        conn = MagicMock()
+        cursor = conn.cursor.return_value
+        cursor.fetchall.return_value = [
+            {'username': 'alice', 'password': 'hash-a'},
+            {'username': 'bob', 'password': 'hash-b'},
+        ]
+        lookup = BatchingUserLookup(max_batch=4, max_wait=0.5)
+        results = {}
+        
+        def worker(name):
+            results[name] = lookup.lookup(name)
+        
+        with patch('app.get_db_connection', return_value=conn):
+            threads = [threading.Thread(target=worker, args=(name,))
+                       for name in ('alice', 'bob', 'ALICE', 'carol')]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        
+        self.assertEqual(cursor.execute.call_count, 1)
+        self.assertEqual(results['alice']['password'], 'hash-a')
+        self.assertEqual(results['ALICE']['password'], 'hash-a')
+        self.assertEqual(results['bob']['password'], 'hash-b')
+        self.assertIsNone(results['carol'])
+    
+    def test_unexpected_error_reaches_callers_and_worker_survives(self):
+        """Test that a non-MySQL failure is raised to callers as an error and later lookups still work"""
+        from mysql.connector import Error
+        from app import BatchingUserLookup
+        lookup = BatchingUserLookup(max_wait=0)
+        
+        with patch('app.get_db_connection', side_effect=TypeError('boom')):
+            with self.assertRaises(Error):
+                lookup.lookup('alice', timeout=1)
+        
+        conn = MagicMock()
+        conn.cursor.return_value.fetchall.return_value = [{'username': 'alice', 'password': 'hash-a'}]
+        with patch('app.get_db_connection', return_value=conn):
+            self.assertEqual(lookup.lookup('alice', timeout=1)['password'], 'hash-a')
+        
+        with patch.object(lookup, '_process', side_effect=[RuntimeError('crash'), None]) as process:
+            lookup._pending.put({'username': 'x', 'done': MagicMock()})
+            lookup._pending.put({'username': 'y', 'done': MagicMock()})
+            deadline = time.monotonic() + 1
+            while process.call_count < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        self.assertEqual(process.call_count, 2)
 
 class APIEndpointTests(unittest.TestCase):
     """Test cases for optimized API endpoints"""
@@ -150,6 +373,210 @@ class APIEndpointTests(unittest.TestCase):
                 self.assertEqual(url, '/api/books/all')
             except Exception as e:
                 self.fail(f"Bulk API endpoint not registered: {e}")
+    
+    def test_api_books_all_reuses_encoded_catalog(self):
+        """Test that the bulk endpoint serves its encoded body until a write invalidates it"""
+        from app import invalidate_caches
+        invalidate_caches()
+        log_in(self.app)
+        books = [(f'B{i:03d}', f'Book {i}', i, 1) for i in range(5)]
+        conn = MagicMock()
+        conn.cursor.return_value.fetchall.return_value = books
+        
+        with patch('app.get_db_connection', return_value=conn):
+            data = self.app.get('/api/books/all').get_json()
+            self.app.get('/api/books/all')
+            self.assertEqual(conn.cursor.return_value.execute.call_count, 1)
+            
+            invalidate_caches()
+            self.app.get('/api/books/all')
+            self.assertEqual(conn.cursor.return_value.execute.call_count, 2)
+        
+        self.assertEqual(data['count'], 5)
+        self.assertEqual(data['columns'], ['Bookid', 'BookName', 'Price', 'Quantity'])
+        self.assertEqual(data['books'], [list(book) for book in books])
+        self.assertEqual(get_cached_book('B003'), ('Book 3', 3, 1))
+    
+    def test_local_catalog_expires(self):
+        """Test that the in-process catalog body is a miss once CACHE_DURATION has passed"""
+        from app import cache_catalog, get_cached_catalog, get_catalog_version, invalidate_caches
+        invalidate_caches()
+        version = get_catalog_version()
+        cache_catalog(version, b'body')
+        self.assertEqual(get_cached_catalog(version), b'body')
+        
+        later = time.monotonic() + CACHE_DURATION.total_seconds() + 1
+        with patch('app.time.monotonic', return_value=later):
+            self.assertIsNone(get_cached_catalog(version))
+    
+    def test_api_books_batch_queries_only_misses(self):
+        """Test that the batch endpoint serves cached books and fetches the rest in one query"""
+        log_in(self.app)
+        cache_book('B001', ('Cached Book', 100, 5))
+        conn = MagicMock()
+        cursor = conn.cursor.return_value
+        cursor.fetchall.return_value = [('B002', 'Fetched Book', 150, 3)]
+        
+        with patch('app.get_db_connection', return_value=conn):
+            response = self.app.get('/api/books?ids=B001,b002,B404')
+        
+        books = response.get_json()['books']
+        self.assertEqual(books['B001']['book_name'], 'Cached Book')
+        self.assertEqual(books['b002']['available_quantity'], 3)
+        self.assertIsNone(books['B404'])
+        cursor.execute.assert_called_once()
+        self.assertEqual(cursor.execute.call_args.args[1], ('b002', 'B404'))
+    
+    def test_api_books_batch_uses_one_redis_round_trip_each_way(self):
+        """Test that the batch endpoint reads cached books with one MGET and caches misses in one pipeline"""
+        log_in(self.app)
+        client = MagicMock()
+        client.mget.return_value = [b'["Cached Book",100,5]', None, None]
+        pipe = client.pipeline.return_value.__enter__.return_value
+        conn = MagicMock()
+        conn.cursor.return_value.fetchall.return_value = [('B002', 'Fetched Book', 150, 3)]
+        
+        with patch('app._redis', client), patch('app.get_db_connection', return_value=conn):
+            books = self.app.get('/api/books?ids=B001,B002,B404').get_json()['books']
+        
+        self.assertEqual(books['B001']['book_name'], 'Cached Book')
+        self.assertEqual(books['B002']['available_quantity'], 3)
+        client.mget.assert_called_once()
+        # The only single-key reads are the catalog version checks around the query
+        self.assertEqual({c.args[0] for c in client.get.call_args_list}, {'bookstore:books_version'})
+        pipe.set.assert_called_once()
+        pipe.execute.assert_called_once()
+    
+    def test_api_book_lookups_skip_cache_after_concurrent_write(self):
+        """Test that rows read while a write bumped the catalog version aren't cached"""
+        log_in(self.app)
+        clear_book_cache()
+        conn = MagicMock()
+        cursor = conn.cursor.return_value
+        cursor.fetchone.return_value = ('Racing Book', 10, 2)
+        cursor.fetchall.return_value = [('RACE3', 'Racing Book', 10, 2)]
+        
+        with patch('app.get_db_connection', return_value=conn), \
+             patch('app.get_catalog_version', side_effect=[1, 2, 1, 2]):
+            self.assertEqual(self.app.get('/api/book/RACE2').status_code, 200)
+            self.assertEqual(self.app.get('/api/books?ids=RACE3').status_code, 200)
+        
+        self.assertIsNone(get_cached_book('RACE2'))
+        self.assertIsNone(get_cached_book('RACE3'))
+    
+    def test_api_book_answers_matching_etag_with_304(self):
+        """Test that a repeated lookup with If-None-Match gets 304 and no body"""
+        log_in(self.app)
+        cache_book('ETAG1', ('Tagged Book', 100, 5))
+        
+        first = self.app.get('/api/book/ETAG1')
+        self.assertEqual(first.headers['Cache-Control'], 'private, no-cache')
+        second = self.app.get('/api/book/ETAG1', headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.data, b'')
+        
+        cache_book('ETAG1', ('Tagged Book', 100, 4))
+        third = self.app.get('/api/book/ETAG1', headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(third.status_code, 200)
+    
+    def test_api_book_etag_same_for_cache_hit_and_miss(self):
+        """Test that the body (and so the strong ETag) doesn't depend on where the book came from"""
+        log_in(self.app)
+        conn = MagicMock()
+        conn.cursor.return_value.fetchone.return_value = ('Tagged Book', 100, 5)
+        
+        with patch('app.get_db_connection', return_value=conn):
+            miss = self.app.get('/api/book/ETAG2')
+        hit = self.app.get('/api/book/ETAG2')
+        
+        self.assertEqual(miss.data, hit.data)
+        self.assertEqual(miss.headers['ETag'], hit.headers['ETag'])
+    
+    def test_api_books_all_served_from_redis(self):
+        """Test that a catalog body cached in Redis for the current version skips the database"""
+        log_in(self.app)
+        import gzip
+        client = MagicMock()
+        body = b'{"success":true,"count":0,"columns":[],"books":[]}'
+        client.get.side_effect = lambda key: {'bookstore:books_version': b'7',
+                                              'bookstore:books_all:v7': gzip.compress(body)}.get(key)
+        
+        with patch('app._redis', client), \
+             patch('app.get_db_connection') as get_conn:
+            response = self.app.get('/api/books/all')
+        
+        self.assertEqual(response.data, body)
+        get_conn.assert_not_called()
+    
+    def test_api_books_all_gzipped_when_accepted(self):
+        """Test that clients accepting gzip get the compressed catalog"""
+        import gzip
+        import json
+        from app import invalidate_caches
+        invalidate_caches()
+        log_in(self.app)
+        conn = MagicMock()
+        conn.cursor.return_value.fetchall.return_value = [('B001', 'Book', 10, 2)] * 50
+        
+        with patch('app.get_db_connection', return_value=conn):
+            response = self.app.get('/api/books/all', headers={'Accept-Encoding': 'gzip, br'})
+        
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(len(json.loads(gzip.decompress(response.data))['books']), 50)
+        
+        with patch('app.get_db_connection', return_value=conn):
+            refused = self.app.get('/api/books/all', headers={'Accept-Encoding': 'gzip;q=0, identity'})
+        self.assertNotIn('Content-Encoding', refused.headers)
+        self.assertEqual(len(refused.get_json()['books']), 50)
+    
+    def test_api_books_all_served_from_refreshed_catalog(self):
+        """Test that a catalog rebuilt by the refresher is served without a query and triggered by writes"""
+        from app import invalidate_caches, catalog_refresher
+        invalidate_caches()
+        log_in(self.app)
+        conn = MagicMock()
+        conn.cursor.return_value.fetchall.return_value = [('B001', 'Book', 10, 2)]
+        
+        with patch('app.get_db_connection', return_value=conn):
+            catalog_refresher.refresh()
+            data = self.app.get('/api/books/all').get_json()
+        
+        self.assertEqual(conn.cursor.return_value.execute.call_count, 1)
+        self.assertEqual(data['books'], [['B001', 'Book', 10, 2]])
+        conn.close.assert_called_once()
+        
+        with patch.object(catalog_refresher, '_wake') as wake:
+            invalidate_caches()
+        wake.set.assert_called_once()
+    
+    def test_catalog_build_skips_book_cache_after_concurrent_write(self):
+        """Test that rows read before a write aren't put back into the book cache after it"""
+        from app import build_catalog
+        clear_book_cache()
+        cursor = MagicMock()
+        cursor.fetchall.return_value = [('RACE1', 'Book', 10, 2)]
+        
+        with patch('app.get_catalog_version', return_value=8):
+            build_catalog(cursor, 7)
+        self.assertIsNone(get_cached_book('RACE1'))
+        
+        with patch('app.get_catalog_version', return_value=7):
+            build_catalog(cursor, 7)
+        self.assertEqual(get_cached_book('RACE1'), ('Book', 10, 2))
+
+class JSONProviderTests(unittest.TestCase):
+    """Test cases for the orjson-backed JSON provider"""
+    
+    def test_jsonify_round_trip(self):
+        """Test that jsonify output decodes back to the same data"""
+        from decimal import Decimal
+        import json
+        with app.test_request_context():
+            from flask import jsonify
+            response = jsonify({'success': True, 'total': Decimal('12.50'), 'books': [1, 2]})
+        data = json.loads(response.get_data(as_text=True))
+        self.assertEqual(data, {'success': True, 'total': '12.50', 'books': [1, 2]})
 
 class ConnectionPoolTests(unittest.TestCase):
     """Test cases for connection pooling functionality"""
@@ -178,6 +605,295 @@ class ConnectionPoolTests(unittest.TestCase):
         self.assertTrue(hasattr(_cache_lock_book, 'release'))
         self.assertTrue(hasattr(_pool_lock, 'acquire'))
         self.assertTrue(hasattr(_pool_lock, 'release'))
+    
+    def test_health_reports_saturated_pool(self):
+        """Test that /health reports a saturated pool as degraded without waiting for a connection"""
+        from mysql.connector import PoolError
+        pool = MagicMock()
+        pool.pool_size = 6
+        pool._cnx_queue.qsize.return_value = 0
+        pool.get_connection.side_effect = PoolError(msg='pool exhausted')
+        
+        with patch('app._connection_pool', pool), patch('app._last_healthy_check', None):
+            response = app.test_client().get('/health')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['status'], 'degraded')
+        self.assertEqual(response.json['pools']['write'], {'pool_size': 6, 'available': 0, 'in_use': 6})
+    
+    def test_pool_monitor_warns_on_sustained_saturation(self):
+        """Test that the pool monitor warns only after consecutive high samples"""
+        from app import PoolMonitor
+        monitor = PoolMonitor(threshold=0.8, samples=3)
+        busy = {'write': {'pool_size': 10, 'available': 1, 'in_use': 9}}
+        
+        with patch('app.get_pool_stats', return_value=busy), \
+             patch.object(app.logger, 'warning') as warning:
+            monitor.sample()
+            monitor.sample()
+            warning.assert_not_called()
+            monitor.sample()
+            warning.assert_called_once()
+    
+    def test_read_pool_fits_max_connections_across_workers(self):
+        """Test that the read pool is shrunk to fit every worker's pools in max_connections"""
+        from app import fit_max_connections
+        config = {'WEB_CONCURRENCY': 4, 'DB_POOL_MAX_OVERFLOW': 5}
+        
+        with patch('app.get_max_connections', return_value=151), \
+             patch.dict(app.config, config):
+            self.assertEqual(fit_max_connections(25, 6), 25)  # 4 * 36 = 144 fits
+            app.config['WEB_CONCURRENCY'] = 9
+            with patch.object(app.logger, 'warning') as warning:
+                self.assertEqual(fit_max_connections(25, 6), 5)  # 151 // 9 - 6 - 5
+            warning.assert_called_once()
+    
+    def test_pool_stats_endpoint_requires_auth(self):
+        """Test that /admin/pool-stats requires authentication"""
+        response = app.test_client().get('/admin/pool-stats')
+        self.assertEqual(response.status_code, 302)
+
+class PaginationTests(unittest.TestCase):
+    """Test cases for /stock page numbers and the /sales keyset cursor"""
+    
+    def setUp(self):
+        """Set up a logged-in test client with no cached stats"""
+        from app import clear_stats_cache
+        clear_stats_cache()
+        self.app = app.test_client()
+        log_in(self.app, 'seller')
+    
+    def get_stock(self, page):
+        """Request a /stock page, returning the response and the page query's parameters"""
+        conn = MagicMock()
+        cursor = conn.cursor.return_value
+        cursor.fetchone.return_value = {'total': 120}
+        cursor.fetchall.return_value = []
+        with patch('app.get_db_connection', return_value=conn):
+            response = self.app.get(f'/stock?page={page}')
+            response.get_data()  # consume the streamed page before the next request
+        return response, cursor.execute.call_args_list[-1].args[1]
+    
+    def test_stock_page_offsets(self):
+        """Test that /stock turns the page number into LIMIT/OFFSET and clamps pages below 1"""
+        from app import PER_PAGE
+        for page, offset in (('0', 0), ('-3', 0), ('abc', 0), ('3', 2 * PER_PAGE)):
+            response, params = self.get_stock(page)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(params, (PER_PAGE, offset))
+    
+    def get_sales(self, headers, query=''):
+        """Request /sales with these transaction headers, returning the response and cursor"""
+        conn = MagicMock()
+        cursor = conn.cursor.return_value
+        cursor.fetchone.return_value = {'total_sales': 0, 'total_transactions': len(headers)}
+        cursor.fetchall.side_effect = [headers, []]
+        with patch('app.get_db_connection', return_value=conn):
+            response = self.app.get('/sales' + query)
+            response.get_data()
+        return response, cursor
+    
+    def sale_headers(self, count):
+        """Header rows for count transactions, newest first"""
+        return [{'transaction_id': f'TXN-{i:03d}', 'CustomerName': 'John', 'PhoneNumber': '1234567890',
+                 'SaleDate': datetime(2026, 1, 1, 12, 0, 0), 'total': 100} for i in range(count, 0, -1)]
+    
+    def test_full_sales_page_links_older_page(self):
+        """Test that a full page of transactions gives a cursor after its last transaction"""
+        from app import PER_PAGE
+        response, cursor = self.get_sales(self.sale_headers(PER_PAGE))
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'before_date=2026-01-01+12:00:00&amp;before_txn=TXN-001', response.data)
+    
+    def test_short_sales_page_has_no_cursor(self):
+        """Test that a page with fewer than PER_PAGE transactions doesn't link an older page"""
+        response, cursor = self.get_sales(self.sale_headers(3), '?before_date=2026-01-02+00%3A00%3A00&before_txn=TXN-999')
+        
+        self.assertNotIn(b'before_txn=', response.data)
+        header_call = cursor.execute.call_args_list[1]
+        self.assertIn('SaleDate < %s', header_call.args[0])
+        self.assertEqual(header_call.args[1][:3], ('2026-01-02 00:00:00', '2026-01-02 00:00:00', 'TXN-999'))
+
+class RequestConnectionTests(unittest.TestCase):
+    """Test cases for the request-scoped db_conn() context manager"""
+    
+    def test_connection_released_at_teardown(self):
+        """Test that the cursor closes with the block and the connection at teardown"""
+        from app import db_conn
+        conn = MagicMock()
+        cursor = conn.cursor.return_value
+        
+        with patch('app.get_db_connection', return_value=conn) as get_conn:
+            with app.test_request_context('/'):
+                with db_conn() as (c1, _):
+                    pass
+                with db_conn() as (c2, _):
+                    pass
+                self.assertIs(c1, c2)
+                self.assertEqual(cursor.close.call_count, 2)
+                conn.close.assert_not_called()
+        
+        get_conn.assert_called_once()
+        conn.close.assert_called_once()
+    
+    def test_rollback_on_error(self):
+        """Test that an exception inside the block rolls the transaction back"""
+        from app import db_conn
+        conn = MagicMock()
+        
+        with patch('app.get_db_connection', return_value=conn):
+            with app.test_request_context('/'):
+                with self.assertRaises(ValueError):
+                    with db_conn() as (_, cursor):
+                        raise ValueError('boom')
+        
+        conn.rollback.assert_called_once()
+        conn.cursor.return_value.close.assert_called_once()
+    
+    def test_reads_use_read_pool(self):
+        """Test that read-only blocks use the read pool unless the user just wrote"""
+        from app import db_conn, mark_write
+        
+        with patch('app.get_db_connection', return_value=MagicMock()) as get_conn:
+            with app.test_request_context('/'):
+                with db_conn(read_only=True):
+                    pass
+            get_conn.assert_called_once_with(kind='read', overflow=True)
+            
+            get_conn.reset_mock()
+            with app.test_request_context('/'):
+                mark_write()
+                with db_conn(read_only=True):
+                    pass
+            get_conn.assert_called_once_with(overflow=True)
+    
+    def test_book_api_uses_read_pool(self):
+        """Test that the book lookup API reads through the read pool"""
+        client = app.test_client()
+        log_in(client)
+        conn = MagicMock()
+        conn.cursor.return_value.fetchone.return_value = ('Pooled Book', 10, 2)
+        
+        with patch('app.get_db_connection', return_value=conn) as get_conn:
+            response = client.get('/api/book/POOL1')
+        
+        self.assertEqual(response.get_json()['book_name'], 'Pooled Book')
+        get_conn.assert_called_once_with(kind='read', overflow=True)
+        conn.close.assert_called_once()
+    
+    def test_replica_reads_not_cached(self):
+        """Test that books read from a lagging replica don't go into the shared cache"""
+        clear_book_cache()
+        client = app.test_client()
+        log_in(client)
+        conn = MagicMock()
+        conn.cursor.return_value.fetchone.return_value = ('Replica Book', 10, 2)
+        conn.cursor.return_value.fetchall.return_value = [('REP2', 'Replica Book', 10, 2)]
+        
+        with patch.dict(app.config, {'REPLICA_URL': 'mysql://replica/store'}), \
+             patch('app.get_db_connection', return_value=conn):
+            self.assertEqual(client.get('/api/book/REP1').get_json()['book_name'], 'Replica Book')
+            self.assertIn('REP2', client.get('/api/books?ids=REP2').get_json()['books'])
+        
+        self.assertIsNone(get_cached_book('REP1'))
+        self.assertIsNone(get_cached_book('REP2'))
+    
+    def test_sell_page_uses_read_pool(self):
+        """Test that the sell form lists books through the read pool"""
+        client = app.test_client()
+        log_in(client, 'seller')
+        conn = MagicMock()
+        conn.cursor.return_value.fetchall.return_value = []
+        
+        with patch('app.get_db_connection', return_value=conn) as get_conn:
+            response = client.get('/sell')
+        
+        self.assertEqual(response.status_code, 200)
+        get_conn.assert_called_once_with(kind='read', overflow=True)
+    
+    def test_exhausted_pool_uses_overflow_connection(self):
+        """Test that an exhausted pool falls back to a temporary unpooled connection"""
+        from mysql.connector import PoolError
+        import app as app_module
+        pool = MagicMock()
+        pool.get_connection.side_effect = PoolError(msg='pool exhausted')
+        overflow_conn = MagicMock()
+        
+        with patch('app.get_connection_pool', return_value=pool), \
+             patch.dict(app_module._pool_settings, {'write': {}}), \
+             patch('mysql.connector.connect', return_value=overflow_conn):
+            with app.test_request_context('/'):
+                self.assertIs(app_module.get_db(), overflow_conn)
+            with app.test_request_context('/'):
+                self.assertIs(app_module.get_db(), overflow_conn)
+        
+        # Each request closed its overflow connection and gave the slot back
+        self.assertEqual(overflow_conn.close.call_count, 2)
+    
+    def test_exhausted_pool_retries_once(self):
+        """Test that an exhausted pool is retried once and counted each time"""
+        from mysql.connector import PoolError
+        import app as app_module
+        pool = MagicMock()
+        pool.get_connection.side_effect = PoolError(msg='pool exhausted')
+        before = app_module._pool_exhausted_total['write']
+        
+        with patch('app.get_connection_pool', return_value=pool), \
+             patch('app.time.sleep'):
+            self.assertIsNone(app_module.get_db_connection(retries=3))
+        
+        self.assertEqual(pool.get_connection.call_count, 2)
+        self.assertEqual(app_module._pool_exhausted_total['write'] - before, 2)
+    
+    def test_login_releases_connection_before_hash_check(self):
+        """Test that login returns its connection before verifying the password"""
+        from werkzeug.security import generate_password_hash
+        conn = MagicMock()
+        conn.cursor.return_value.fetchone.return_value = (generate_password_hash('secret'),)
+        
+        def check(password_hash, password):
+            conn.close.assert_called_once()
+            return True
+        
+        with patch('app.get_db_connection', return_value=conn), \
+             patch('app.check_password_hash', side_effect=check) as mock_check:
+            response = app.test_client().post('/login', data={'username': 'alice', 'password': 'secret'})
+        
+        mock_check.assert_called_once()
+        self.assertEqual(response.status_code, 302)
+    
+    def test_login_upgrades_legacy_pbkdf2_hash(self):
+        """Test that a successful login re-hashes a pbkdf2 password and leaves a scrypt one alone"""
+        from werkzeug.security import generate_password_hash, check_password_hash
+        for method, upgraded in (('pbkdf2:sha256', True), ('scrypt', False)):
+            conn = MagicMock()
+            cursor = conn.cursor.return_value
+            cursor.fetchone.return_value = (generate_password_hash('secret', method=method),)
+            
+            with patch('app.get_db_connection', return_value=conn):
+                response = app.test_client().post('/login', data={'username': 'alice', 'password': 'secret'})
+            
+            self.assertEqual(response.status_code, 302)
+            updates = [c for c in cursor.execute.call_args_list if c.args[0].startswith('UPDATE signup')]
+            if upgraded:
+                self.assertEqual(len(updates), 1)
+                new_hash, username = updates[0].args[1]
+                self.assertFalse(new_hash.startswith('pbkdf2:'))
+                self.assertTrue(check_password_hash(new_hash, 'secret'))
+                self.assertEqual(username, 'alice')
+            else:
+                self.assertEqual(updates, [])
+    
+    def test_unavailable_database_raises(self):
+        """Test that a missing connection raises DatabaseUnavailable"""
+        from app import db_conn, DatabaseUnavailable
+        
+        with patch('app.get_db_connection', return_value=None):
+            with app.test_request_context('/'):
+                with self.assertRaises(DatabaseUnavailable):
+                    with db_conn():
+                        pass
 
 class ErrorHandlingTests(unittest.TestCase):
     """Test cases for improved error handling"""